@@ -3,136 +3,230 @@ from hashlib import sha256
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 import os
+from database import get_database
+from user_directory import get_user_directory
+from write_queue import get_write_queue
 
 class AuthSystem:
-    def __init__(self):
-        self.conn = sqlite3.connect('models/users.db')
-        self.cursor = self.conn.cursor()
-        self._create_tables()
-
-    def _create_tables(self):
-        # Tabla de usuarios
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                face_id INTEGER
-            )
-        ''')
-        # Tabla de mensajes
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender_id INTEGER,
-                receiver_id INTEGER,
-                message TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Tabla de archivos (solo imágenes en este caso)
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender_id INTEGER,
-                receiver_id INTEGER,
-                file_path TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
+    def __init__(self, db=None):
+        # Conexión compartida (una por hilo); el esquema se crea una sola vez
+        self.db = db or get_database()
+        self.db.ensure_schema()
+        # Búsquedas de usuarios en memoria; las escrituras la actualizan
+        self.users = get_user_directory(self.db)
+        # Mensajes y archivos se confirman en lotes desde un hilo escritor
+        self.writes = get_write_queue(self.db)
+
+    @property
+    def conn(self):
+        return self.db.connection()
 
     def register_user(self, username, password, face_id=None):
         try:
             hashed_password = sha256(password.encode()).hexdigest()
-            self.cursor.execute(
-                'INSERT INTO users (username, password, face_id) VALUES (?, ?, ?)',
-                (username, hashed_password, face_id)
-            )
-            self.conn.commit()
+            with self.db.transaction() as conn:
+                cursor = conn.execute(
+                    'INSERT INTO users (username, password, face_id) VALUES (?, ?, ?)',
+                    (username, hashed_password, face_id)
+                )
+            self.users.add((cursor.lastrowid, username, hashed_password, face_id))
             return True
         except sqlite3.IntegrityError:
             return False
 
     def login_user(self, username, password):
         hashed_password = sha256(password.encode()).hexdigest()
-        self.cursor.execute(
-            'SELECT * FROM users WHERE username=? AND password=?',
-            (username, hashed_password)
-        )
-        return self.cursor.fetchone()
+        user = self.users.by_username(username)
+        if user and user[2] == hashed_password:
+            return user
+        return None
 
     def login_with_face(self, face_id):
-        self.cursor.execute(
-            'SELECT * FROM users WHERE face_id=?',
-            (face_id,)
-        )
-        return self.cursor.fetchone()
+        return self.users.by_face_id(face_id)
 
     def get_user_by_username(self, username):
-        self.cursor.execute('SELECT * FROM users WHERE username=?', (username,))
-        return self.cursor.fetchone()
+        return self.users.by_username(username)
+
+    def get_user_id(self, username):
+        row = self.users.by_username(username)
+        return row[0] if row else None
+
+    def set_face_id(self, user_id, face_id):
+        with self.db.transaction() as conn:
+            conn.execute('UPDATE users SET face_id=? WHERE id=?', (face_id, user_id))
+        self.users.set_face_id(user_id, face_id)
 
     def get_all_users(self):
-        self.cursor.execute('SELECT username FROM users')
-        return [row[0] for row in self.cursor.fetchall()]
+        return self.users.usernames()
 
     def send_message(self, sender_id, receiver_username, message):
+        """
+        Encola un mensaje; se guarda en el siguiente lote de la cola de escritura
+        Returns:
+            Future or bool: Future que se resuelve al confirmarse la escritura,
+                o False si el destinatario no existe
+        """
         receiver = self.get_user_by_username(receiver_username)
         if not receiver:
             return False
-        receiver_id = receiver[0]
-        self.cursor.execute(
+        return self.writes.submit(
             'INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, ?)',
-            (sender_id, receiver_id, message)
+            (sender_id, receiver[0], message)
         )
-        self.conn.commit()
-        return True
+
+    def send_message_to_many(self, sender_id, receiver_usernames, message):
+        """
+        Envía el mismo mensaje a varios destinatarios en una sola operación
+        Returns:
+            tuple: (Future de todas las escrituras o None si no hay destinatarios
+                válidos, lista de destinatarios no encontrados)
+        """
+        receivers, missing = self._resolve_receivers(receiver_usernames)
+        if not receivers:
+            return None, missing
+        future = self.writes.submit_many([
+            ('INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, ?)',
+             (sender_id, receiver[0], message))
+            for receiver in receivers
+        ])
+        return future, missing
+
+    def _resolve_receivers(self, receiver_usernames):
+        receivers, missing = [], []
+        for username in dict.fromkeys(receiver_usernames):
+            receiver = self.get_user_by_username(username)
+            if receiver:
+                receivers.append(receiver)
+            else:
+                missing.append(username)
+        return receivers, missing
 
     def get_messages_for_user(self, user_id):
-        self.cursor.execute('''
+        return self.db.execute('''
             SELECT users.username, messages.message, messages.timestamp
             FROM messages
             JOIN users ON users.id = messages.sender_id
             WHERE receiver_id=?
             ORDER BY messages.timestamp DESC
-        ''', (user_id,))
-        return self.cursor.fetchall()
+        ''', (user_id,)).fetchall()
+
+    def get_messages_page(self, user_id, page_size=50, cursor=None):
+        """
+        Devuelve una página de mensajes recibidos, del más reciente al más antiguo
+        Args:
+            user_id: ID del destinatario
+            page_size: Número máximo de filas por página
+            cursor: next_cursor de la página anterior, o None para la primera
+        Returns:
+            tuple: (filas (username, message, timestamp), next_cursor o None si no hay más)
+        """
+        return self._fetch_page('''
+            SELECT messages.timestamp, messages.id,
+                   users.username, messages.message, messages.timestamp
+            FROM messages
+            JOIN users ON users.id = messages.sender_id
+            WHERE receiver_id=? {after_cursor}
+            ORDER BY messages.timestamp DESC, messages.id DESC
+            LIMIT ?
+        ''', 'AND (messages.timestamp, messages.id) < (?, ?)', user_id, page_size, cursor)
+
+    def _fetch_page(self, sql, after_cursor, user_id, page_size, cursor):
+        # Lo enviado desde esta aplicación debe verse ya en la bandeja
+        if self.writes.pending:
+            self.writes.flush()
+        # Paginación por clave (timestamp, id) en lugar de OFFSET: cada página
+        # continúa donde acabó la anterior recorriendo el índice del destinatario
+        if cursor is None:
+            sql, params = sql.format(after_cursor=''), (user_id, page_size + 1)
+        else:
+            sql, params = sql.format(after_cursor=after_cursor), (user_id, cursor[0], cursor[1], page_size + 1)
+        rows = self.db.execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1][0], rows[-1][1])
+        return [row[2:] for row in rows], next_cursor
 
-    def save_file(self, sender_id, receiver_username, file_path):
+    def save_file(self, sender_id, receiver_username, file_path, blob=None):
+        """
+        Encola el registro de una imagen enviada
+        Returns:
+            Future or bool: Future que se resuelve al confirmarse la escritura,
+                o False si no es una imagen o el destinatario no existe
+        """
+        future, missing = self.save_file_to_many(sender_id, [receiver_username], file_path, blob)
+        return future or False
+
+    def save_file_to_many(self, sender_id, receiver_usernames, file_path, blob=None):
+        """
+        Registra la misma imagen para varios destinatarios en una sola operación
+        Returns:
+            tuple: (Future de todas las escrituras o None si no se registra
+                nada, lista de destinatarios no encontrados)
+        """
         # Verificar que sea imagen
         if not file_path.lower().endswith((".jpg", ".jpeg", ".png")):
-            return False
+            return None, []
 
-        receiver = self.get_user_by_username(receiver_username)
-        if not receiver:
-            return False
+        receivers, missing = self._resolve_receivers(receiver_usernames)
+        if not receivers:
+            return None, missing
 
         # Guardar ruta relativa
-        receiver_id = receiver[0]
         relative_path = os.path.relpath(file_path, start=os.getcwd())
-        self.cursor.execute(
-            'INSERT INTO files (sender_id, receiver_id, file_path) VALUES (?, ?, ?)',
-            (sender_id, receiver_id, relative_path)
-        )
-        self.conn.commit()
-        return True
+        if blob is None:
+            statements = [
+                ('INSERT INTO files (sender_id, receiver_id, file_path) VALUES (?, ?, ?)',
+                 (sender_id, receiver[0], relative_path))
+                for receiver in receivers
+            ]
+        else:
+            # Archivo del almacén por contenido: el blob se registra una sola vez
+            statements = [('INSERT OR IGNORE INTO blobs (hash, path, size) VALUES (?, ?, ?)',
+                           (blob.hash, relative_path, blob.size))]
+            statements += [
+                ('INSERT INTO files (sender_id, receiver_id, file_path, blob_hash, file_name) '
+                 'VALUES (?, ?, ?, ?, ?)',
+                 (sender_id, receiver[0], relative_path, blob.hash, blob.name))
+                for receiver in receivers
+            ]
+        return self.writes.submit_many(statements), missing
 
     def get_files_for_user(self, user_id):
-        self.cursor.execute('''
+        return self.db.execute('''
             SELECT users.username, files.file_path, files.timestamp
             FROM files
             JOIN users ON users.id = files.sender_id
             WHERE receiver_id=?
             ORDER BY files.timestamp DESC
-        ''', (user_id,))
-        return self.cursor.fetchall()
+        ''', (user_id,)).fetchall()
+
+    def get_files_page(self, user_id, page_size=50, cursor=None):
+        """
+        Devuelve una página de archivos recibidos, del más reciente al más antiguo
+        Args:
+            user_id: ID del destinatario
+            page_size: Número máximo de filas por página
+            cursor: next_cursor de la página anterior, o None para la primera
+        Returns:
+            tuple: (filas (username, file_path, timestamp, file_name, blob_hash),
+                next_cursor o None si no hay más); file_name es el nombre original
+                del archivo y blob_hash el hash de su contenido (None en archivos
+                anteriores al almacén de subidas)
+        """
+        return self._fetch_page('''
+            SELECT files.timestamp, files.id,
+                   users.username, files.file_path, files.timestamp, files.file_name,
+                   files.blob_hash
+            FROM files
+            JOIN users ON users.id = files.sender_id
+            WHERE receiver_id=? {after_cursor}
+            ORDER BY files.timestamp DESC, files.id DESC
+            LIMIT ?
+        ''', 'AND (files.timestamp, files.id) < (?, ?)', user_id, page_size, cursor)
 
     def show_error_popup(self, message):
         popup = Popup(title='Error',
                      content=Label(text=message),
                      size_hint=(None, None), size=(400, 200))
         popup.open()
-
-    def __del__(self):
-        self.conn.close()
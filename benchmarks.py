@@ -0,0 +1,412 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import cv2
+import numpy as np
+
+# Kivy no debe interpretar los argumentos de este script
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+BENCHMARKS = ('auth_queries', 'train_model', 'detect_faces', 'frame_to_texture', 'capture_face_samples',
+              'histogram_index')
+# Métrica que se compara con la línea base en cada prueba (menor es mejor)
+BASELINE_METRIC = 'p50_ms'
+# Escalas de detección medidas en detect_faces; la primera da el resumen
+DETECTION_SCALES = ('1.0', '0.5', 'auto')
+
+
+def _stats(timings):
+    """Resumen en milisegundos de una lista de tiempos en segundos"""
+    ms = np.asarray(timings, dtype=np.float64) * 1000.0
+    return {
+        'iterations': int(ms.size),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'max_ms': float(ms.max()),
+        'total_s': float(ms.sum() / 1000.0),
+    }
+
+
+def _time(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class BenchmarkSuite:
+    """
+    Pruebas de rendimiento de los caminos críticos sin cámara ni pantalla.
+    Se ejecutan dentro de un directorio de trabajo propio (base de datos,
+    muestras y modelo de prueba) con los frames de open_frame_source, de modo
+    que no tocan los datos reales de la aplicación.
+    """
+
+    def __init__(self, source='synthetic', users=20, samples=10, messages=2000, frames=100,
+                 detection_scales=DETECTION_SCALES, index_samples=3000):
+        """
+        Args:
+            source: Fuente de frames (ver open_frame_source)
+            users: Usuarios registrados en la base de datos de prueba
+            samples: Muestras de rostro por usuario
+            messages: Mensajes en la base de datos de prueba
+            frames: Frames procesados en las pruebas por frame
+            detection_scales: Escalas de detección a medir ('auto' o número)
+            index_samples: Muestras del modelo sintético de histogram_index
+        """
+        self.source = source
+        self.users = users
+        self.samples = samples
+        self.messages = messages
+        self.frames = frames
+        self.detection_scales = [str(scale) for scale in detection_scales]
+        self.index_samples = index_samples
+        self._seeded = False
+
+    def params(self):
+        return {
+            'source': str(self.source),
+            'users': self.users,
+            'samples': self.samples,
+            'messages': self.messages,
+            'frames': self.frames,
+            'detection_scales': self.detection_scales,
+            'index_samples': self.index_samples,
+        }
+
+    def _seed(self):
+        """Crea usuarios, muestras de rostro y mensajes de prueba"""
+        if self._seeded:
+            return
+        from auth import AuthSystem
+        from sample_store import get_sample_store
+        from frame_sources import draw_face
+
+        auth = AuthSystem()
+        store = get_sample_store()
+        rng = np.random.default_rng(0)
+        for user_id in range(1, self.users + 1):
+            auth.register_user(f'bench_{user_id}', 'bench_password')
+            for i in range(self.samples):
+                face = np.full((140, 140, 3), int(rng.integers(60, 120)), dtype=np.uint8)
+                draw_face(face, 70 + int(rng.integers(-6, 7)), 70 + int(rng.integers(-6, 7)),
+                          int(rng.integers(100, 125)), tone=user_id)
+                store.append(user_id, face)
+        rows = [(int(rng.integers(1, self.users + 1)), int(rng.integers(1, self.users + 1)), f'Mensaje {i}')
+                for i in range(self.messages)]
+        with auth.db.transaction() as conn:
+            conn.executemany('INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, ?)', rows)
+        self._seeded = True
+
+    def _face_recognition(self, **kwargs):
+        from face_recognition import FaceRecognition
+        return FaceRecognition(frame_source=self.source, **kwargs)
+
+    def bench_auth_queries(self):
+        from auth import AuthSystem
+        self._seed()
+        auth = AuthSystem()
+        username = f'bench_{max(1, self.users // 2)}'
+        user_id = auth.get_user_id(username)
+        iterations = max(50, self.frames)
+        results = {
+            'login_user': _stats(_time(lambda: auth.login_user(username, 'bench_password'), iterations)),
+            'get_user_by_username': _stats(_time(lambda: auth.get_user_by_username(username), iterations)),
+            'get_all_users': _stats(_time(auth.get_all_users, iterations)),
+            'get_messages_page': _stats(_time(lambda: auth.get_messages_page(user_id), iterations)),
+        }
+        # Resumen: primera página de la bandeja de entrada, la consulta más frecuente
+        summary = dict(results['get_messages_page'])
+        summary['queries'] = results
+        return summary
+
+    def bench_train_model(self):
+        import train_faces
+        self._seed()
+        start = time.perf_counter()
+        ok = train_faces.train_model()
+        elapsed = time.perf_counter() - start
+        if not ok:
+            raise Exception("El entrenamiento no produjo un modelo")
+        result = _stats([elapsed])
+        result['images'] = self.users * self.samples
+        return result
+
+    def bench_detect_faces(self):
+        from frame_sources import open_frame_source
+        from face_recognition import parse_detection_scale
+        self._seed()
+        source = open_frame_source(self.source, fps=None)
+        try:
+            frames = []
+            while len(frames) < self.frames:
+                ret, frame = source.read()
+                if not ret:
+                    break
+                frames.append(frame)
+        finally:
+            source.release()
+        if not frames:
+            raise Exception("La fuente no entregó frames")
+
+        # Mismos frames con cada escala; el resumen es el de la primera
+        scales = {}
+        for scale in self.detection_scales:
+            face_recognition = self._face_recognition(detection_scale=parse_detection_scale(scale))
+            try:
+                scales[scale] = self._detect_frames(face_recognition, frames)
+            finally:
+                face_recognition.release_camera()
+        summary = dict(scales[self.detection_scales[0]])
+        summary['scales'] = scales
+        return summary
+
+    @staticmethod
+    def _detect_frames(face_recognition, frames):
+        timings, faces = [], 0
+        for frame in frames:
+            frame = frame.copy()
+            start = time.perf_counter()
+            results = face_recognition.recognize(frame)
+            face_recognition.draw_results(frame, results)
+            timings.append(time.perf_counter() - start)
+            faces += len(results)
+        result = _stats(timings)
+        result['faces'] = faces
+        result['detection'] = face_recognition.get_detection_stats()
+        result['final_scale'] = face_recognition.detection_scale
+        result['model_loaded'] = face_recognition.model_loaded
+        return result
+
+    def bench_frame_to_texture(self):
+        from frame_sources import open_frame_source
+        try:
+            # Las texturas necesitan un contexto OpenGL (ventana de Kivy)
+            from kivy.core.window import Window
+        except Exception as e:
+            return {'skipped': f"Sin contexto OpenGL: {str(e)}"}
+        if Window is None:
+            return {'skipped': "Sin contexto OpenGL"}
+        from face_recognition import PreviewRenderer
+
+        renderer = PreviewRenderer()
+        source = open_frame_source(self.source, fps=None)
+        try:
+            frames = [source.read()[1] for _ in range(min(self.frames, 30))]
+        finally:
+            source.release()
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            raise Exception("La fuente no entregó frames")
+        timings = []
+        for i in range(self.frames):
+            frame = frames[i % len(frames)]
+            start = time.perf_counter()
+            renderer.render(frame)
+            timings.append(time.perf_counter() - start)
+        return _stats(timings)
+
+    def bench_capture_face_samples(self):
+        self._seed()
+        face_recognition = self._face_recognition()
+        try:
+            start = time.perf_counter()
+            captured = face_recognition.capture_face_samples(self.users + 1, self.samples, deadline=30.0)
+            elapsed = time.perf_counter() - start
+        finally:
+            face_recognition.release_camera()
+        result = _stats([elapsed])
+        result['captured'] = bool(captured)
+        return result
+
+    def bench_histogram_index(self, samples_per_user=20, queries=50, centroid_candidates=8):
+        """
+        Reconocimiento sobre un modelo grande: recognizer.predict frente al
+        índice exacto y al índice con búsqueda por centroides (el que usa el
+        modo 'auto' de FaceRecognition). El modelo se entrena en memoria con
+        rostros sintéticos, sin tocar la base de datos de prueba
+        """
+        from histogram_index import HistogramIndex
+        from face_preprocessing import get_face_normalizer
+
+        normalizer = get_face_normalizer()
+        rng = np.random.default_rng(1)
+        textures = {}
+
+        def synthetic_face(user_id):
+            # Textura propia de cada usuario (las caras dibujadas se parecen
+            # demasiado entre sí para LBPH), desplazada y con ruido por muestra
+            texture = textures.get(user_id)
+            if texture is None:
+                cells = np.random.default_rng(user_id).integers(0, 256, (12, 12), dtype=np.uint8)
+                texture = textures[user_id] = cv2.resize(cells, (112, 112), interpolation=cv2.INTER_CUBIC)
+            dx, dy = (int(v) for v in rng.integers(0, 13, 2))
+            face = texture[dy:dy + 100, dx:dx + 100] + rng.integers(-10, 11, (100, 100), dtype=np.int16)
+            return normalizer.normalize(np.clip(face, 0, 255).astype(np.uint8))
+
+        users = max(1, self.index_samples // samples_per_user)
+        labels = np.repeat(np.arange(1, users + 1), samples_per_user).astype(np.int32)
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.train([synthetic_face(int(label)) for label in labels], labels)
+        query_labels = rng.integers(1, users + 1, queries)
+        query_faces = [synthetic_face(int(label)) for label in query_labels]
+
+        variants = {}
+        start = time.perf_counter()
+        exact = HistogramIndex.from_recognizer(recognizer)
+        exact_build = time.perf_counter() - start
+        start = time.perf_counter()
+        centroids = HistogramIndex.from_recognizer(recognizer, centroid_candidates=centroid_candidates)
+        centroid_build = time.perf_counter() - start
+
+        reference = [recognizer.predict(face)[0] for face in query_faces]
+        for name, predict in (('recognizer', recognizer.predict), ('exact', exact.predict),
+                              ('centroids', centroids.predict)):
+            predicted = []
+            timings = _time(lambda: predicted.append(predict(query_faces[len(predicted)])[0]), queries)
+            variants[name] = _stats(timings)
+            variants[name]['agreement'] = float(np.mean(np.asarray(predicted) == reference))
+            variants[name]['accuracy'] = float(np.mean(np.asarray(predicted) == query_labels))
+        variants['exact']['build_ms'] = exact_build * 1000.0
+        variants['centroids']['build_ms'] = centroid_build * 1000.0
+
+        # Resumen: el camino que usa el modo 'auto' con modelos grandes
+        summary = dict(variants['centroids'])
+        summary['samples'] = int(labels.size)
+        summary['matrix_mb'] = exact.nbytes / 2**20
+        summary['variants'] = variants
+        return summary
+
+    def run(self, names=BENCHMARKS):
+        """
+        Ejecuta las pruebas indicadas; un fallo en una no detiene las demás
+        Returns:
+            dict: Resultados en formato JSON serializable
+        """
+        results = {}
+        for name in names:
+            print(f"Ejecutando {name}...")
+            try:
+                results[name] = getattr(self, f'bench_{name}')()
+            except Exception as e:
+                print(f"Error en {name}: {str(e)}")
+                results[name] = {'error': str(e)}
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+                'cpus': os.cpu_count(),
+            },
+            'params': self.params(),
+            'results': results,
+        }
+
+
+def compare_with_baseline(report, baseline, tolerance=0.2):
+    """
+    Compara un informe con uno anterior
+    Args:
+        report: Resultado de BenchmarkSuite.run()
+        baseline: Informe de referencia con el mismo formato
+        tolerance: Empeoramiento relativo admitido antes de marcar regresión
+    Returns:
+        list: Diccionarios {name, baseline, current, change, regression}
+    """
+    comparison = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name, {})
+        if BASELINE_METRIC not in current or BASELINE_METRIC not in previous:
+            continue
+        change = (current[BASELINE_METRIC] - previous[BASELINE_METRIC]) / max(previous[BASELINE_METRIC], 1e-9)
+        comparison.append({
+            'name': name,
+            'baseline': previous[BASELINE_METRIC],
+            'current': current[BASELINE_METRIC],
+            'change': change,
+            'regression': change > tolerance,
+        })
+    return comparison
+
+
+def _print_report(report, comparison):
+    for name, result in report['results'].items():
+        if 'error' in result:
+            print(f"{name:24s} ERROR {result['error']}")
+        elif 'skipped' in result:
+            print(f"{name:24s} omitida: {result['skipped']}")
+        else:
+            print(f"{name:24s} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                  f"({result['iterations']} iteraciones)")
+            for scale, variant in result.get('scales', {}).items():
+                print(f"  escala {scale:15s} p50 {variant['p50_ms']:9.2f} ms  p95 {variant['p95_ms']:9.2f} ms  "
+                      f"(final {variant['final_scale']:.2f})")
+            for variant_name, variant in result.get('variants', {}).items():
+                print(f"  {variant_name:22s} p50 {variant['p50_ms']:9.2f} ms  p95 {variant['p95_ms']:9.2f} ms  "
+                      f"(coincidencia {variant['agreement']:.0%})")
+    for row in comparison:
+        mark = "REGRESIÓN" if row['regression'] else "ok"
+        print(f"{row['name']:24s} {row['baseline']:9.2f} -> {row['current']:9.2f} ms ({row['change']:+.1%}) {mark}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento sin cámara")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Pruebas a ejecutar (por defecto, todas)")
+    parser.add_argument('--source', default='synthetic',
+                        help="Fuente de frames: 'synthetic', vídeo o directorio de imágenes")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=10, help="Muestras por usuario")
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--index-samples', type=int, default=3000,
+                        help="Muestras del modelo sintético de histogram_index")
+    parser.add_argument('--detection-scales', nargs='+', default=list(DETECTION_SCALES),
+                        metavar='ESCALA', help="Escalas de detección a medir en detect_faces ('auto' o número)")
+    parser.add_argument('--workdir', default=None,
+                        help="Directorio de datos de prueba (por defecto, uno temporal)")
+    parser.add_argument('--output', default=None, help="Archivo JSON donde guardar los resultados")
+    parser.add_argument('--baseline', default=None, help="Resultados anteriores con los que comparar")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Empeoramiento relativo admitido frente a la línea base")
+    args = parser.parse_args()
+
+    # Rutas absolutas antes de cambiar al directorio de trabajo
+    source = args.source if args.source.startswith('synthetic') or args.source.isdigit() else os.path.abspath(args.source)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory(prefix='bench_') as tmp_dir:
+        workdir = args.workdir or tmp_dir
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        suite = BenchmarkSuite(source, args.users, args.samples, args.messages, args.frames,
+                               args.detection_scales, args.index_samples)
+        report = suite.run(args.only)
+        from database import get_database
+        get_database().close_all()
+
+    comparison = []
+    if baseline_path:
+        with open(baseline_path) as f:
+            comparison = compare_with_baseline(report, json.load(f), args.tolerance)
+        report['comparison'] = comparison
+
+    _print_report(report, comparison)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados guardados en {output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    raise SystemExit(1 if any(row['regression'] for row in comparison) else 0)
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'models/users.db'
+
+
+class Database:
+    """
+    Acceso compartido a SQLite con una conexión configurada por hilo.
+    La interfaz, los workers de reconocimiento y el entrenamiento usan cada uno
+    su propia conexión sobre el mismo fichero, en modo WAL para que las
+    lecturas no esperen a las escrituras.
+    """
+
+    def __init__(self, path=DB_PATH, cached_statements=256, busy_timeout=5.0):
+        """
+        Args:
+            path: Ruta del fichero de base de datos
+            cached_statements: Sentencias preparadas que reutiliza cada conexión
+            busy_timeout: Segundos de espera si otra conexión tiene el bloqueo
+        """
+        self.path = path
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self):
+        """Devuelve la conexión del hilo actual, creándola la primera vez"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # check_same_thread=False solo para poder cerrarla desde close_all();
+            # cada conexión la usa únicamente el hilo que la creó
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   cached_statements=self.cached_statements,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.connection().executemany(sql, seq_of_params)
+
+    def commit(self):
+        self.connection().commit()
+
+    @contextmanager
+    def transaction(self):
+        """Confirma al salir del bloque o deshace si se produce una excepción"""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def ensure_schema(self):
+        """Crea las tablas una única vez por proceso"""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            with self.transaction() as conn:
+                _create_tables(conn)
+                _apply_migrations(conn)
+            self._schema_ready = True
+
+    def close(self):
+        """Cierra la conexión del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        """Cierra todas las conexiones abiertas; usado al cerrar la aplicación"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def _create_tables(conn):
+    # Tabla de usuarios
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            face_id INTEGER
+        )
+    ''')
+    # Tabla de mensajes
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            receiver_id INTEGER,
+            message TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Tabla de archivos (solo imágenes en este caso)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            receiver_id INTEGER,
+            file_path TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _add_column(conn, table, column, definition):
+    # Bases de datos en las que una versión anterior interrumpió la migración
+    # tras añadir la columna sin llegar a actualizar user_version
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _migration_inbox_indexes(conn):
+    # Bandeja de entrada: filtro por destinatario y orden por fecha
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_receiver_timestamp
+        ON messages (receiver_id, timestamp)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_files_receiver_timestamp
+        ON files (receiver_id, timestamp)
+    ''')
+
+
+def _migration_upload_blobs(conn):
+    # Archivos subidos guardados una sola vez por contenido
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER,
+            created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _add_column(conn, 'files', 'blob_hash', 'TEXT REFERENCES blobs(hash)')
+    _add_column(conn, 'files', 'file_name', 'TEXT')
+
+
+def _migration_users_face_id_index(conn):
+    # Inicio de sesión facial cuando el usuario no está en la caché
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_face_id ON users (face_id)')
+
+
+# Migraciones en orden; PRAGMA user_version guarda cuántas se han aplicado
+MIGRATIONS = [
+    _migration_inbox_indexes,
+    _migration_upload_blobs,
+    _migration_users_face_id_index,
+]
+
+
+def _apply_migrations(conn):
+    # sqlite3 no abre transacción implícita antes de DDL: cada migración va en
+    # una explícita junto con su user_version, de modo que un fallo a medias
+    # no deja cambios aplicados sin registrar. BEGIN IMMEDIATE además impide
+    # que otro proceso aplique la misma migración a la vez
+    if conn.in_transaction:
+        conn.commit()
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            migration = MIGRATIONS[version]
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migración {version + 1} aplicada: {migration.__name__}")
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path=DB_PATH):
+    """Instancia compartida de Database para la ruta indicada"""
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
@@ -0,0 +1,85 @@
+import time
+from collections import deque, namedtuple
+
+# Decisión tomada: label es None si el rostro se rechazó como desconocido;
+# elapsed son los segundos desde la primera observación hasta decidir
+Decision = namedtuple('Decision', ['label', 'confidence', 'votes', 'frames', 'elapsed'])
+
+
+class DecisionEngine:
+    """
+    Acumula los resultados de reconocimiento de varios frames antes de decidir.
+    Cada frame aporta a su etiqueta una evidencia (accept_confidence - confianza),
+    positiva si la predicción es buena y negativa si es dudosa. Se acepta en
+    cuanto una etiqueta reúne accept_evidence y la mayoría de los votos de la
+    ventana; se rechaza cuando la ventana está llena y nadie supera
+    reject_evidence.
+    """
+
+    def __init__(self, window=15, accept_confidence=85, accept_evidence=60,
+                 reject_evidence=0, min_votes=2):
+        """
+        Args:
+            window: Número de frames con rostro que se tienen en cuenta
+            accept_confidence: Confianza LBPH (menor es mejor) que aporta evidencia positiva
+            accept_evidence: Evidencia acumulada necesaria para aceptar
+            reject_evidence: Con la ventana llena, por debajo de esto se rechaza
+            min_votes: Votos mínimos de la etiqueta ganadora para aceptar
+        """
+        self.window = window
+        self.accept_confidence = accept_confidence
+        self.accept_evidence = accept_evidence
+        self.reject_evidence = reject_evidence
+        self.min_votes = min_votes
+        self.reset()
+
+    def reset(self):
+        """Descarta las observaciones y la decisión para empezar de nuevo"""
+        self._observations = deque(maxlen=self.window)
+        self._started = None
+        self.frames = 0
+        self.decision = None
+
+    @property
+    def decided(self):
+        return self.decision is not None
+
+    def add(self, results):
+        """
+        Añade los resultados de un frame
+        Args:
+            results: Lista de FaceMatch de FaceRecognition.recognize()
+        Returns:
+            Decision or None: La decisión en cuanto la hay; None mientras falte evidencia
+        """
+        if self.decision is not None:
+            return self.decision
+
+        # Mejor predicción del frame (menor confianza); sin rostro no hay voto
+        scored = [match for match in results if match.confidence is not None]
+        if not scored:
+            return None
+        best = min(scored, key=lambda match: match.confidence)
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.frames += 1
+        self._observations.append((best.label, best.confidence))
+
+        evidence, votes, confidences = {}, {}, {}
+        for label, confidence in self._observations:
+            evidence[label] = evidence.get(label, 0.0) + (self.accept_confidence - confidence)
+            votes[label] = votes.get(label, 0) + 1
+            confidences.setdefault(label, []).append(confidence)
+
+        label = max(evidence, key=evidence.get)
+        majority = votes[label] * 2 > len(self._observations)
+        if (evidence[label] >= self.accept_evidence and majority
+                and votes[label] >= self.min_votes):
+            self.decision = self._decide(label, confidences[label], votes[label])
+        elif len(self._observations) == self.window and evidence[label] < self.reject_evidence:
+            self.decision = self._decide(None, confidences[label], votes[label])
+        return self.decision
+
+    def _decide(self, label, confidences, votes):
+        return Decision(label, sum(confidences) / len(confidences), votes, self.frames,
+                        time.perf_counter() - self._started)
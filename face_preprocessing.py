@@ -0,0 +1,124 @@
+import os
+import json
+import threading
+import cv2
+
+FACE_SIZE = (100, 100)  # (ancho, alto) canónico de los recortes de rostro
+METADATA_VERSION = 1
+
+
+class FaceNormalizer:
+    """
+    Lleva cada recorte de rostro a la misma forma antes de pasarlo a LBPH:
+    escala de grises, tamaño fijo y, opcionalmente, ecualización del
+    histograma. Así el coste de extraer histogramas no depende de lo cerca
+    que esté la cara de la cámara, y captura, entrenamiento y predicción ven
+    exactamente el mismo tipo de imagen.
+    """
+
+    def __init__(self, size=FACE_SIZE, equalize=False):
+        """
+        Args:
+            size: Tamaño (ancho, alto) de los recortes normalizados
+            equalize: Si es True ecualiza el histograma de cada recorte
+        """
+        self.size = (int(size[0]), int(size[1]))
+        self.equalize = bool(equalize)
+
+    def resize(self, face):
+        """Convierte un recorte a escala de grises y al tamaño canónico"""
+        if face.ndim == 3:
+            face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        if (face.shape[1], face.shape[0]) != self.size:
+            interpolation = cv2.INTER_AREA if face.shape[1] > self.size[0] else cv2.INTER_LINEAR
+            face = cv2.resize(face, self.size, interpolation=interpolation)
+        return face
+
+    def normalize(self, face):
+        """
+        Args:
+            face: Recorte de rostro BGR o en escala de grises de cualquier tamaño
+        Returns:
+            ndarray: Recorte uint8 normalizado; si ya lo estaba se devuelve sin copiar
+        """
+        face = self.resize(face)
+        if self.equalize:
+            face = cv2.equalizeHist(face)
+        return face
+
+    def metadata(self):
+        """Datos del preprocesado que se guardan junto al modelo"""
+        return {
+            'version': METADATA_VERSION,
+            'size': list(self.size),
+            'equalize': self.equalize,
+        }
+
+    def __repr__(self):
+        return f"FaceNormalizer(size={self.size}, equalize={self.equalize})"
+
+
+def metadata_path(model_path):
+    """Ruta del archivo de metadatos de un modelo (models/recognizer.meta.json)"""
+    return os.path.splitext(model_path)[0] + '.meta.json'
+
+
+def write_model_metadata(model_path, normalizer):
+    """Guarda junto al modelo el preprocesado con el que se entrenó"""
+    path = metadata_path(model_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(normalizer.metadata(), f)
+    os.replace(tmp_path, path)
+
+
+def read_model_metadata(model_path):
+    """
+    Returns:
+        dict or None: Metadatos del modelo o None si no tiene (modelo antiguo)
+    """
+    path = metadata_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_model_metadata(model_path, normalizer):
+    """
+    Comprueba que un modelo se entrenó con el mismo preprocesado que se va a
+    usar al predecir
+    Raises:
+        Exception: Si el modelo no tiene metadatos o no coinciden
+    """
+    meta = read_model_metadata(model_path)
+    if meta is None:
+        raise Exception(f"El modelo {model_path} no tiene metadatos de preprocesado; "
+                        "reconstrúyalo con train_faces.py --rebuild")
+    expected = normalizer.metadata()
+    mismatched = [key for key in expected if meta.get(key) != expected[key]]
+    if mismatched:
+        found = {key: meta.get(key) for key in mismatched}
+        wanted = {key: expected[key] for key in mismatched}
+        raise Exception(f"El modelo {model_path} se entrenó con {found} y se esperaba {wanted}; "
+                        "reconstrúyalo con train_faces.py --rebuild")
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def get_face_normalizer():
+    """Instancia compartida de FaceNormalizer"""
+    global _normalizer
+    with _normalizer_lock:
+        if _normalizer is None:
+            _normalizer = FaceNormalizer()
+        return _normalizer
+
+
+def set_face_normalizer(normalizer):
+    """Sustituye el preprocesado compartido (antes de entrenar o cargar modelos)"""
+    global _normalizer
+    with _normalizer_lock:
+        _normalizer = normalizer
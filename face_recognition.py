@@ -1,19 +1,466 @@
 import cv2
 import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
+from histogram_index import HistogramIndex
+from sample_store import get_sample_store
+from sample_quality import SampleQualityGate
+from face_preprocessing import get_face_normalizer, check_model_metadata, write_model_metadata
+from frame_sources import open_frame_source
+from pipeline_metrics import get_metrics
 from kivy.graphics.texture import Texture
 from kivy.clock import Clock
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 
-class FaceRecognition:
+class FrameGrabber:
+    """
+    Hilo dedicado que lee frames de la cámara y conserva solo los más recientes.
+    El hilo principal de Kivy consulta latest_frame() sin bloquearse nunca
+    esperando a la cámara; los frames que nadie llega a consumir se descartan.
+    """
+
+    def __init__(self, capture, buffer_size=2):
+        """
+        Args:
+            capture: cv2.VideoCapture ya abierto
+            buffer_size: Número máximo de frames retenidos en el buffer circular
+        """
+        self.capture = capture
+        self._frames = deque(maxlen=max(1, buffer_size))
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self.frames_grabbed = 0
+        self.frames_consumed = 0
+        self.frames_dropped = 0
+        self.read_errors = 0
+        self.metrics = get_metrics()
+
+    def start(self):
+        """Arranca el hilo de captura si no está en marcha"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='FrameGrabber', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Detiene el hilo de captura y vacía el buffer"""
+        self._running = False
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            self.frames_dropped += len(self._frames)
+            self._frames.clear()
+
+    @property
+    def running(self):
+        return self._running
+
+    def _run(self):
+        while self._running:
+            with self.metrics.stage('capture_read'):
+                ret, frame = self.capture.read()
+            if not ret:
+                self.read_errors += 1
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                # El deque descarta el frame más antiguo al llenarse
+                if len(self._frames) == self._frames.maxlen:
+                    self.frames_dropped += 1
+                self._frames.append(frame)
+                self.frames_grabbed += 1
+
+    def latest_frame(self):
+        """
+        Devuelve el frame más reciente sin bloquear
+        Returns:
+            ndarray or None: Frame nuevo o None si no hay ninguno desde la última llamada
+        """
+        with self._lock:
+            if not self._frames:
+                return None
+            frame = self._frames.pop()
+            # Los frames más antiguos que quedaban ya no se mostrarán nunca
+            self.frames_dropped += len(self._frames)
+            self._frames.clear()
+            self.frames_consumed += 1
+            return frame
+
+    def get_stats(self):
+        """Estadísticas de frames capturados, consumidos y descartados"""
+        with self._lock:
+            return {
+                'grabbed': self.frames_grabbed,
+                'consumed': self.frames_consumed,
+                'dropped': self.frames_dropped,
+                'pending': len(self._frames),
+                'read_errors': self.read_errors,
+            }
+
+
+class PreviewRenderer:
+    """
+    Vuelca frames BGR de OpenCV en una textura Kivy reutilizada.
+    Hay una textura por resolución: se sube el frame tal cual en formato 'bgr'
+    y la inversión vertical se resuelve con las coordenadas de la textura, así
+    que en régimen estable no se reserva memoria por frame.
+    """
+
     def __init__(self):
-        """Inicializa el sistema de reconocimiento facial"""
+        self._textures = {}
+        self._buffers = {}
+
+    def texture_for(self, width, height):
+        """Textura reutilizable para la resolución indicada"""
+        texture = self._textures.get((width, height))
+        if texture is None:
+            texture = Texture.create(size=(width, height), colorfmt='bgr')
+            # OpenCV guarda la primera fila arriba y OpenGL abajo
+            texture.flip_vertical()
+            self._textures[(width, height)] = texture
+        return texture
+
+    def render(self, frame):
+        """
+        Args:
+            frame: Imagen BGR de 8 bits
+        Returns:
+            Texture: Textura actualizada con el contenido del frame
+        """
+        h, w = frame.shape[:2]
+        texture = self.texture_for(w, h)
+        if not (frame.flags['C_CONTIGUOUS'] and frame.flags['WRITEABLE']):
+            # blit_buffer exige un buffer contiguo y escribible
+            buf = self._buffers.get(frame.shape)
+            if buf is None:
+                buf = self._buffers[frame.shape] = np.empty(frame.shape, dtype=np.uint8)
+            np.copyto(buf, frame)
+            frame = buf
+        texture.blit_buffer(frame.reshape(-1), colorfmt='bgr', bufferfmt='ubyte',
+                            mipmap_generation=False)
+        return texture
+
+
+# Resultado de reconocimiento de un rostro; label y confidence son None sin modelo
+FaceMatch = namedtuple('FaceMatch', ['x', 'y', 'w', 'h', 'label', 'confidence'])
+
+
+class RecognitionWorker:
+    """
+    Ejecuta la detección y el reconocimiento en un hilo aparte.
+    Solo admite un frame en vuelo: mientras hay un reconocimiento en curso los
+    frames enviados se descartan, de modo que la vista previa y el
+    reconocimiento avanzan cada uno a su propio ritmo.
+    """
+
+    def __init__(self, face_recognition):
+        """
+        Args:
+            face_recognition: Instancia de FaceRecognition que hace el trabajo
+        """
+        self.face_recognition = face_recognition
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._running = True
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self._thread = threading.Thread(target=self._run, name='RecognitionWorker', daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """True si hay un frame en proceso o esperando"""
+        with self._cond:
+            return self._busy or self._pending is not None
+
+    def submit(self, frame, callback=None, copy=False):
+        """
+        Envía un frame a reconocer sin bloquear
+        Args:
+            frame: Imagen BGR; el worker no la modifica
+            callback: Función opcional que recibe el Future al terminar
+            copy: Si es True el worker guarda una copia del frame, solo cuando
+                lo acepta (quien lo envía puede seguir dibujando sobre él)
+        Returns:
+            Future or None: Future con la lista de FaceMatch, o None si se descartó
+        """
+        with self._cond:
+            if not self._running or self._busy or self._pending is not None:
+                self.frames_dropped += 1
+                return None
+            if copy:
+                frame = frame.copy()
+            future = Future()
+            if callback:
+                future.add_done_callback(callback)
+            self._pending = (frame, future)
+            self.frames_submitted += 1
+            self._cond.notify()
+            return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                frame, future = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(self.face_recognition.recognize(frame))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self.frames_processed += 1
+
+    def stop(self, timeout=1.0):
+        """Detiene el hilo y cancela el frame pendiente"""
+        with self._cond:
+            self._running = False
+            if self._pending is not None:
+                self._pending[1].cancel()
+                self._pending = None
+            self._cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        """Estadísticas de frames enviados, descartados y procesados"""
+        with self._cond:
+            return {
+                'submitted': self.frames_submitted,
+                'dropped': self.frames_dropped,
+                'processed': self.frames_processed,
+            }
+
+
+# Estado de una captura de muestras tras procesar un frame. state es
+# 'capturing', 'saving' (esperando a que se escriban las últimas muestras),
+# 'done' o 'failed'; rejected cuenta los rostros descartados por calidad y
+# last_rejection es el motivo del último; message explica el fallo
+CaptureProgress = namedtuple('CaptureProgress', ['state', 'accepted', 'samples', 'attempts', 'message',
+                                                 'rejected', 'last_rejection'])
+
+
+class EnrollmentCapture:
+    """
+    Captura de muestras de registro paso a paso, un frame cada vez.
+    Quien muestra la vista previa le pasa cada frame nuevo con step(), que
+    nunca bloquea: detecta el rostro, acepta o descarta el frame y deja la
+    escritura de la muestra a un hilo aparte. Solo se guardan los rostros que
+    pasan el filtro de calidad (nitidez, exposición y variedad). La captura
+    falla si se supera el plazo o el número máximo de intentos sin reunir
+    todas las muestras. Las muestras se escriben en un registro provisional
+    que solo sustituye a las de un registro anterior cuando la captura se
+    completa; si falla o se cancela se descarta y las anteriores se conservan.
+    """
+
+    def __init__(self, face_recognition, user_id, samples=20, deadline=30.0, max_attempts=300,
+                 quality=None):
+        """
+        Args:
+            face_recognition: Instancia de FaceRecognition usada para detectar
+            user_id: ID del usuario a registrar
+            samples: Número de muestras a capturar
+            deadline: Segundos máximos de captura, aunque la cámara no entregue frames
+            max_attempts: Frames máximos procesados
+            quality: SampleQualityGate a aplicar; por defecto uno nuevo con
+                los umbrales estándar
+        """
+        self.face_recognition = face_recognition
+        self.quality = quality or SampleQualityGate()
+        self.quality.reset()
+        self.last_rejection = None
+        self.user_id = user_id
+        self.samples = samples
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.accepted = 0
+        self.attempts = 0
+        self.state = 'capturing'
+        self.message = None
+        self._started = time.perf_counter()
+        self._store = get_sample_store()
+        self._writes = []
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='EnrollmentWriter')
+        # Restos de una captura anterior interrumpida
+        self._writes.append(self._writer.submit(self._store.discard_pending, user_id))
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def progress(self):
+        return CaptureProgress(self.state, self.accepted, self.samples, self.attempts, self.message,
+                               self.rejected, self.last_rejection)
+
+    @property
+    def rejected(self):
+        return self.quality.get_stats()['rejected']
+
+    def step(self, frame):
+        """
+        Procesa un frame de la cámara
+        Args:
+            frame: Imagen BGR; si se acepta se marca el rostro sobre ella
+        Returns:
+            CaptureProgress: Estado de la captura tras este frame
+        """
+        if self.state == 'capturing' and frame is not None:
+            self.attempts += 1
+            self._process(frame)
+            if self.accepted >= self.samples:
+                self.state = 'saving'
+                # El hilo escritor lo ejecuta tras la última muestra
+                self._writes.append(self._writer.submit(self._commit_samples, list(self._writes)))
+        if self.state == 'capturing':
+            if time.perf_counter() - self._started > self.deadline:
+                self._fail(f"Tiempo agotado: {self.accepted}/{self.samples} muestras "
+                           f"({self.rejected} descartadas por calidad)")
+            elif self.attempts >= self.max_attempts:
+                self._fail(f"Demasiados intentos: {self.accepted}/{self.samples} muestras "
+                           f"({self.rejected} descartadas por calidad)")
+        if self.state == 'saving' and all(write.done() for write in self._writes):
+            self._finish()
+        return self.progress()
+
+    def _process(self, frame):
+        self.last_rejection = None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_recognition._detect_scaled(gray, 1.3, 5)
+        if len(faces) == 0:
+            return
+
+        # Tomar solo el primer rostro detectado y validar su tamaño
+        (x, y, w, h) = faces[0]
+        if w <= 20 or h <= 20:
+            return
+
+        face_roi = gray[y:y+h, x:x+w]
+        self.last_rejection = self.quality.check(face_roi)
+        if self.last_rejection is not None:
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
+            return
+
+        # Copia del recorte: el frame sigue usándose para la vista previa
+        face_roi = face_roi.copy()
+        self._writes.append(self._writer.submit(self._store.append, self.user_id, face_roi, True))
+        self.accepted += 1
+
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        cv2.putText(frame, f"Muestras: {self.accepted}/{self.samples}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+    def _commit_samples(self, writes):
+        # Solo sustituye las muestras anteriores si todas las nuevas se guardaron
+        for write in writes:
+            if write.exception() is not None:
+                self._store.discard_pending(self.user_id)
+                raise write.exception()
+        self._store.commit_pending(self.user_id)
+
+    def _finish(self):
+        errors = [write.exception() for write in self._writes if write.exception() is not None]
+        if errors:
+            self._fail(f"Error guardando muestras: {str(errors[0])}")
+        else:
+            self.state = 'done'
+            self._writer.shutdown(wait=False)
+            print(f"Captura completada: {self.accepted} muestras en {self.attempts} frames; "
+                  f"calidad: {self.quality.get_stats()}")
+
+    def _fail(self, message):
+        self.state = 'failed'
+        self.message = message
+        # Las escrituras ya encoladas terminan antes; las muestras anteriores
+        # del usuario no se tocan
+        self._writes.append(self._writer.submit(self._store.discard_pending, self.user_id))
+        self._writer.shutdown(wait=False)
+        print(f"Captura fallida: {message}")
+
+    def cancel(self):
+        """
+        Detiene la captura y descarta en segundo plano las muestras nuevas.
+        No tiene efecto una vez reunidas todas ('saving'): la sustitución de
+        las muestras anteriores ya está encolada y la captura se completa
+        """
+        if self.state == 'capturing':
+            self._fail("Captura cancelada")
+
+    def wait(self, timeout=None):
+        """Espera a que se escriban las muestras aceptadas"""
+        for write in list(self._writes):
+            try:
+                write.result(timeout)
+            except Exception:
+                pass
+
+
+def parse_detection_scale(value):
+    """
+    Args:
+        value: 'auto' o un número entre 0 y 1, como número o texto
+    Returns:
+        float or str: Escala para FaceRecognition.set_detection_scale
+    """
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value == 'auto':
+            return value
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"Escala de detección no válida: {value}")
+    return value
+
+
+class FaceRecognition:
+    def __init__(self, frame_source=None, detect_every=5, roi_margin=0.5, detection_scale=None):
+        """
+        Inicializa el sistema de reconocimiento facial
+        Args:
+            frame_source: Fuente de frames en lugar de la cámara (ver
+                open_frame_source); por defecto la variable de entorno
+                FACE_FRAME_SOURCE o, si no existe, la primera cámara disponible
+            detect_every: Frames entre detecciones completas (ver set_tracking)
+            roi_margin: Margen de la región de seguimiento (ver set_tracking)
+            detection_scale: Escala de detección, número entre 0 y 1 o 'auto'
+                (ver set_detection_scale); por defecto la variable de entorno
+                FACE_DETECTION_SCALE o, si no existe, 1.0
+        """
+        self.frame_source = frame_source if frame_source is not None else os.environ.get('FACE_FRAME_SOURCE')
+        self.metrics = get_metrics()
         self._initialize_directories()
         self._load_face_cascade()
         self._initialize_recognizer()
         self._initialize_camera()
         self.is_training = False
+        self.confidence_threshold = 85
+        self._initialize_tracking(detect_every, roi_margin)
+        if detection_scale is None:
+            detection_scale = os.environ.get('FACE_DETECTION_SCALE', '1.0')
+        self.set_detection_scale(parse_detection_scale(detection_scale))
+        self.metrics.register_provider('grabber', self._grabber_stats)
+        self.metrics.register_provider('detection', self.get_detection_stats)
+
+    def _grabber_stats(self):
+        grabber = getattr(self, 'grabber', None)
+        return grabber.get_stats() if grabber is not None else {}
 
     def _initialize_directories(self):
         """Crea los directorios necesarios si no existen"""
@@ -33,163 +480,491 @@ class FaceRecognition:
     def _initialize_recognizer(self):
         """Inicializa el reconocedor LBPH"""
         self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self.recognizer_lock = threading.Lock()
         self.model_path = 'models/recognizer.yml'
         self.model_loaded = False
+        # 'missing' (sin modelo), 'loaded', 'needs_rebuild' (entrenado con otro
+        # preprocesado o sin metadatos) o 'error'
+        self.model_status = 'missing'
+        self.histogram_index = None
+        self._index_generation = 0
+        self._index_thread = None
+        self.normalizer = get_face_normalizer()
+        self.use_histogram_index('auto')
         
         # Intentar cargar modelo existente
         if os.path.exists(self.model_path) and os.path.getsize(self.model_path) > 0:
             try:
-                self.recognizer.read(self.model_path)
-                self.model_loaded = True
-                print("Modelo cargado exitosamente")
+                # Un modelo entrenado con otro preprocesado no es comparable
+                check_model_metadata(self.model_path, self.normalizer)
             except Exception as e:
-                print(f"Error cargando modelo: {str(e)}")
-                self.model_loaded = False
+                print(f"Modelo no utilizable: {str(e)}")
+                self.model_status = 'needs_rebuild'
+            else:
+                try:
+                    self.recognizer.read(self.model_path)
+                    self.model_loaded = True
+                    self.model_status = 'loaded'
+                    print("Modelo cargado exitosamente")
+                except Exception as e:
+                    print(f"Error cargando modelo: {str(e)}")
+                    self.model_loaded = False
+                    self.model_status = 'error'
+        self._rebuild_histogram_index()
+
+    def use_histogram_index(self, mode=True, min_samples=2000, centroid_candidates=8, **options):
+        """
+        Elige el backend de reconocimiento
+        Args:
+            mode: True usa siempre HistogramIndex, False siempre recognizer.predict
+                y 'auto' usa el índice con búsqueda por centroides solo con
+                modelos de al menos min_samples muestras. La búsqueda exacta
+                del índice cuesta lo mismo que recognizer.predict; lo que
+                escala es revisar solo los usuarios más cercanos
+            min_samples: Umbral del modo 'auto'
+            centroid_candidates: Usuarios revisados tras comparar centroides
+                en el modo 'auto'
+            options: Opciones de HistogramIndex (metric, centroid_candidates...)
+        """
+        self.histogram_index_mode = mode
+        self.histogram_index_min_samples = min_samples
+        self.histogram_index_centroids = centroid_candidates
+        self.histogram_index_options = options
+        if hasattr(self, 'recognizer_lock'):
+            self._rebuild_histogram_index()
+
+    def _rebuild_histogram_index(self):
+        """
+        Descarta el índice actual y construye el del reconocedor vigente en un
+        hilo de fondo; mientras tanto recognize() usa recognizer.predict
+        """
+        with self.recognizer_lock:
+            self._index_generation += 1
+            generation = self._index_generation
+            recognizer = self.recognizer
+            self.histogram_index = None
+            if not (self.model_loaded and self.histogram_index_mode):
+                return
+        self._index_thread = threading.Thread(target=self._build_histogram_index,
+                                              args=(recognizer, generation),
+                                              name='HistogramIndexBuilder', daemon=True)
+        self._index_thread.start()
+
+    def _build_histogram_index(self, recognizer, generation):
+        # Los reconocedores no se modifican una vez publicados, así que se
+        # leen sin el cerrojo; solo el cambio de índice lo toma
+        try:
+            options = dict(self.histogram_index_options)
+            if self.histogram_index_mode == 'auto':
+                if len(recognizer.getLabels()) < self.histogram_index_min_samples:
+                    return
+                options.setdefault('centroid_candidates', self.histogram_index_centroids)
+            start = time.perf_counter()
+            index = HistogramIndex.from_recognizer(recognizer, **options)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"Error construyendo el índice de histogramas: {str(e)}")
+            return
+        with self.recognizer_lock:
+            if generation != self._index_generation:
+                return  # El modelo cambió mientras se construía
+            self.histogram_index = index
+        print(f"Índice de histogramas listo: {len(index)} muestras, "
+              f"{index.nbytes / 2**20:.0f} MB en {elapsed:.2f}s")
+
+    def wait_histogram_index(self, timeout=None):
+        """Espera a que termine la construcción del índice en curso, si la hay"""
+        thread = self._index_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return self.histogram_index
+
+    def _initialize_tracking(self, detect_every=5, roi_margin=0.5):
+        """Estado y contadores del modo detectar-y-seguir"""
+        self.reset_tracking()
+        self.set_tracking(detect_every, roi_margin)
+
+    def set_tracking(self, detect_every=None, roi_margin=None):
+        """
+        Configura el modo detectar-y-seguir: la detección completa solo se hace
+        cada detect_every frames o cuando se pierde el rostro; entre medias se
+        busca de nuevo únicamente alrededor del último recuadro. Se puede
+        cambiar en caliente; las estadísticas de detección se conservan
+        Args:
+            detect_every: Frames entre detecciones completas (1 desactiva el
+                seguimiento); None mantiene el valor actual
+            roi_margin: Margen añadido al último recuadro, relativo a su
+                tamaño; None mantiene el valor actual
+        """
+        if detect_every is not None:
+            if int(detect_every) < 1:
+                raise ValueError(f"detect_every no válido: {detect_every}")
+            self.detect_every = int(detect_every)
+            self.tracking_enabled = self.detect_every > 1
+        if roi_margin is not None:
+            if roi_margin < 0:
+                raise ValueError(f"roi_margin no válido: {roi_margin}")
+            self.roi_margin = float(roi_margin)
+
+    def reset_tracking(self):
+        """
+        Olvida los rostros seguidos y pone a cero las estadísticas de detección;
+        la próxima llamada hará detección completa. Las pantallas lo llaman al
+        adquirir la instancia compartida para no heredar el estado de la anterior
+        """
+        self._tracked_faces = []
+        self._frames_since_detection = 0
+        self.detection_frames = 0
+        self.full_detections = 0
+        self.track_hits = 0
+        self.track_misses = 0
+
+    def get_detection_stats(self):
+        """
+        Returns:
+            dict: Frames procesados, detecciones completas, tasa de detección
+                completa y tasa de acierto del seguimiento
+        """
+        tracked = self.track_hits + self.track_misses
+        return {
+            'frames': self.detection_frames,
+            'full_detections': self.full_detections,
+            'detection_rate': self.full_detections / self.detection_frames if self.detection_frames else 0.0,
+            'track_hits': self.track_hits,
+            'track_misses': self.track_misses,
+            'tracking_hit_rate': self.track_hits / tracked if tracked else 0.0,
+        }
+
+    def set_detection_scale(self, scale, budget_ms=20.0, min_scale=0.25):
+        """
+        Configura la resolución a la que se ejecuta el clasificador. Los
+        recuadros se devuelven siempre en coordenadas del frame original, así
+        que los recortes para LBPH conservan todo el detalle
+        Args:
+            scale: Factor entre 0 y 1, o 'auto' para ajustarlo según la latencia
+            budget_ms: Tiempo objetivo por detección en modo automático
+            min_scale: Escala mínima permitida en modo automático
+        """
+        if scale == 'auto':
+            self.auto_detection_scale = True
+            self.detection_scale = getattr(self, 'detection_scale', 1.0)
+        else:
+            if not 0 < scale <= 1:
+                raise ValueError(f"Escala de detección no válida: {scale}")
+            self.auto_detection_scale = False
+            self.detection_scale = float(scale)
+        self.detection_budget = budget_ms / 1000.0
+        self.min_detection_scale = min_scale
+        self.detection_latency = None
+
+    def _update_detection_scale(self, elapsed):
+        # Media móvil de la latencia; la escala baja si se supera el presupuesto
+        # y sube de nuevo cuando sobra margen
+        if self.detection_latency is None:
+            self.detection_latency = elapsed
+        else:
+            self.detection_latency = 0.8 * self.detection_latency + 0.2 * elapsed
+        if not self.auto_detection_scale:
+            return
+        if self.detection_latency > self.detection_budget:
+            self.detection_scale = max(self.min_detection_scale, self.detection_scale * 0.85)
+        elif self.detection_latency < self.detection_budget * 0.5:
+            self.detection_scale = min(1.0, self.detection_scale * 1.1)
+
+    def _detect_scaled(self, gray, scaleFactor, minNeighbors, minSize=None):
+        """
+        Ejecuta el clasificador sobre una copia reducida del frame
+        Returns:
+            list: Recuadros (x, y, w, h) en coordenadas del frame original
+        """
+        start = time.perf_counter()
+        scale = self.detection_scale
+        params = {'scaleFactor': scaleFactor, 'minNeighbors': minNeighbors}
+        if scale < 1.0:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if minSize:
+                params['minSize'] = (max(1, int(minSize[0] * scale)), max(1, int(minSize[1] * scale)))
+        else:
+            small = gray
+            if minSize:
+                params['minSize'] = minSize
+        found = self.face_cascade.detectMultiScale(small, **params)
+
+        frame_h, frame_w = gray.shape[:2]
+        faces = []
+        for (x, y, w, h) in found:
+            x, y = int(x / scale), int(y / scale)
+            w, h = min(int(round(w / scale)), frame_w - x), min(int(round(h / scale)), frame_h - y)
+            faces.append((x, y, w, h))
+        self._update_detection_scale(time.perf_counter() - start)
+        return faces
+
+    def _detect_full(self, gray):
+        return self._detect_scaled(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+
+    def _track(self, gray):
+        """
+        Busca cada rostro seguido dentro de su recuadro ampliado
+        Returns:
+            list or None: Recuadros encontrados o None si se perdió alguno
+        """
+        frame_h, frame_w = gray.shape[:2]
+        faces = []
+        for (x, y, w, h) in self._tracked_faces:
+            mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+            found = self.face_cascade.detectMultiScale(
+                gray[y0:y1, x0:x1],
+                scaleFactor=1.1,
+                minNeighbors=5,
+                minSize=(max(30, w // 2), max(30, h // 2))
+            )
+            if len(found) == 0:
+                return None
+            # Quedarse con el recuadro más grande de la región
+            fx, fy, fw, fh = max(found, key=lambda f: f[2] * f[3])
+            faces.append((int(fx) + x0, int(fy) + y0, int(fw), int(fh)))
+        return faces
+
+    def _detect(self, gray):
+        """Detecta rostros usando el seguimiento cuando es posible"""
+        self.detection_frames += 1
+        if (self.tracking_enabled and self._tracked_faces
+                and self._frames_since_detection < self.detect_every - 1):
+            faces = self._track(gray)
+            if faces is not None:
+                self.track_hits += 1
+                self._frames_since_detection += 1
+                self._tracked_faces = faces
+                return faces
+            self.track_misses += 1
+
+        faces = self._detect_full(gray)
+        self.full_detections += 1
+        self._frames_since_detection = 0
+        self._tracked_faces = faces
+        return faces
 
     def _initialize_camera(self):
         """Inicializa la cámara con múltiples intentos"""
-        for i in range(3):  # Probar hasta 3 cámaras diferentes
+        if self.frame_source is not None:
+            # Vídeo grabado, directorio de imágenes o frames sintéticos
+            self.capture = open_frame_source(self.frame_source)
+            if not self.capture.isOpened():
+                raise Exception(f"No se pudo abrir la fuente de frames: {self.frame_source}")
+            self.grabber = FrameGrabber(self.capture)
+            self.grabber.start()
+            return
+        candidates = [0, 1, 2]  # Probar hasta 3 cámaras diferentes
+        # Si ya se abrió antes, probar primero el mismo dispositivo
+        camera_index = getattr(self, 'camera_index', None)
+        if camera_index in candidates:
+            candidates.remove(camera_index)
+            candidates.insert(0, camera_index)
+        for i in candidates:
             self.capture = cv2.VideoCapture(i)
             if self.capture.isOpened():
                 # Configurar resolución óptima
                 self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
                 self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                self.camera_index = i
+                self.grabber = FrameGrabber(self.capture)
+                self.grabber.start()
                 return
+            self.capture.release()
         raise Exception("No se pudo abrir ninguna cámara disponible")
 
-    def capture_face_samples(self, user_id, samples=20):
+    @property
+    def camera_open(self):
+        """True si la cámara está abierta y el hilo de captura en marcha"""
+        grabber = getattr(self, 'grabber', None)
+        capture = getattr(self, 'capture', None)
+        return bool(grabber and grabber.running and capture and capture.isOpened())
+
+    def open_camera(self):
+        """Vuelve a abrir la cámara si se liberó previamente"""
+        if not self.camera_open:
+            self._initialize_camera()
+
+    def latest_frame(self):
         """
-        Captura muestras faciales para un usuario específico
+        Obtiene el último frame capturado por el hilo de la cámara sin bloquear
+        Returns:
+            ndarray or None: Frame más reciente o None si aún no hay uno nuevo
+        """
+        grabber = getattr(self, 'grabber', None)
+        if grabber is None:
+            return None
+        return grabber.latest_frame()
+
+    def capture_face_samples(self, user_id, samples=20, deadline=30.0, max_attempts=300):
+        """
+        Captura muestras faciales para un usuario específico de forma bloqueante
+        (para scripts; la interfaz usa EnrollmentCapture frame a frame)
         Args:
             user_id: ID del usuario
             samples: Número de muestras a capturar
+            deadline: Segundos máximos de captura
+            max_attempts: Frames máximos procesados
         Returns:
-            bool: True si se capturaron muestras exitosamente
+            bool: True si se completó la captura y las muestras sustituyeron a
+                las anteriores
         """
-        samples_path = f'data/user_{user_id}'
-        os.makedirs(samples_path, exist_ok=True)
-        
-        count = 0
-        while count < samples:
-            ret, frame = self.capture.read()
-            if not ret:
-                print("Error: No se pudo capturar frame de la cámara")
-                continue
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            
-            if len(faces) == 0:
-                print("Advertencia: No se detectaron rostros en el frame")
-                continue
-            
-            # Tomar solo el primer rostro detectado
-            (x, y, w, h) = faces[0]
-            
-            # Validar región de interés
-            if w <= 20 or h <= 20:  # Tamaño mínimo del rostro
-                continue
-            
-            try:
-                face_roi = gray[y:y+h, x:x+w]
-                
-                # Guardar la imagen del rostro
-                img_path = os.path.join(samples_path, f"{count}.jpg")
-                if not cv2.imwrite(img_path, face_roi):
-                    raise Exception(f"No se pudo guardar la imagen {img_path}")
-                
-                count += 1
-                print(f"Muestra {count}/{samples} capturada")
-                
-                # Mostrar feedback visual
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(frame, f"Muestras: {count}/{samples}", (10, 30),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                
-            except Exception as e:
-                print(f"Error procesando rostro: {str(e)}")
-                continue
-        
-        return count > 0  # Retorna True si se capturó al menos una muestra
+        capture = EnrollmentCapture(self, user_id, samples, deadline, max_attempts)
+        progress = capture.progress()
+        while not capture.finished:
+            frame = self.latest_frame()
+            if frame is None:
+                time.sleep(0.005)
+            previous = progress.accepted
+            progress = capture.step(frame)
+            if progress.accepted > previous:
+                print(f"Muestra {progress.accepted}/{samples} capturada")
+        capture.wait()
+        return progress.state == 'done'  # Una captura incompleta no guarda nada
 
-    def detect_faces(self, frame):
+    def recognize(self, frame):
         """
-        Detecta y reconoce rostros en un frame
+        Detecta y reconoce rostros sin modificar el frame
         Args:
-            frame: Imagen donde detectar rostros
+            frame: Imagen BGR donde detectar rostros
         Returns:
-            int or None: ID del rostro reconocido o None si no se reconoce
+            list: Lista de FaceMatch; se detiene en el primer rostro reconocido
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        with self.metrics.stage('cvt_color'):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with self.metrics.stage('detect'):
+            faces = self._detect(gray)
         
+        results = []
         for (x, y, w, h) in faces:
-            roi = gray[y:y+h, x:x+w]
-            
+            label, confidence = None, None
             if self.model_loaded:
                 try:
-                    label, confidence = self.recognizer.predict(roi)
-                    if confidence < 85:
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        cv2.putText(frame, f'Usuario: {label}', (x, y-10),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                        return label
-                    
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
-                    cv2.putText(frame, 'Desconocido', (x, y-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-                    
+                    with self.metrics.stage('predict'):
+                        roi = self.normalizer.normalize(gray[y:y+h, x:x+w])
+                        index = self.histogram_index
+                        if index is not None:
+                            label, confidence = index.predict(roi)
+                        else:
+                            with self.recognizer_lock:
+                                label, confidence = self.recognizer.predict(roi)
                 except Exception as e:
                     print(f"Error en reconocimiento: {str(e)}")
                     self.model_loaded = False
-            
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
+                    self.model_status = 'error'
+            results.append(FaceMatch(int(x), int(y), int(w), int(h), label, confidence))
+            if confidence is not None and confidence < self.confidence_threshold:
+                break
         
+        return results
+
+    def best_match(self, results):
+        """
+        Args:
+            results: Lista de FaceMatch devuelta por recognize()
+        Returns:
+            int or None: ID del primer rostro reconocido o None
+        """
+        for match in results:
+            if match.confidence is not None and match.confidence < self.confidence_threshold:
+                return match.label
         return None
 
+    def draw_results(self, frame, results):
+        """Dibuja sobre el frame los recuadros de los rostros reconocidos"""
+        for (x, y, w, h, label, confidence) in results:
+            if confidence is None:
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
+            elif confidence < self.confidence_threshold:
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                cv2.putText(frame, f'Usuario: {label}', (x, y-10),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+            else:
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
+                cv2.putText(frame, 'Desconocido', (x, y-10),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+
+    def detect_faces(self, frame):
+        """
+        Detecta y reconoce rostros en un frame de forma síncrona
+        Args:
+            frame: Imagen donde detectar rostros
+        Returns:
+            int or None: ID del rostro reconocido o None si no se reconoce
+        """
+        results = self.recognize(frame)
+        self.draw_results(frame, results)
+        return self.best_match(results)
+
     def frame_to_texture(self, frame):
         """
         Convierte un frame de OpenCV a textura Kivy
         Args:
             frame: Imagen a convertir
         Returns:
-            Texture: Textura para mostrar en Kivy
+            Texture: Textura para mostrar en Kivy (la misma en cada llamada
+                para una resolución dada)
         """
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            buf = cv2.flip(frame_rgb, 0).tobytes()
-            texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='rgb')
-            texture.blit_buffer(buf, colorfmt='rgb', bufferfmt='ubyte')
-            return texture
+            if not hasattr(self, 'preview'):
+                self.preview = PreviewRenderer()
+            with self.metrics.stage('texture'):
+                return self.preview.render(frame)
         except Exception as e:
             print(f"Error convirtiendo frame a textura: {str(e)}")
             return None
 
     def release_camera(self):
         """Libera los recursos de la cámara"""
+        grabber = getattr(self, 'grabber', None)
+        if grabber is not None:
+            grabber.stop()
+            print(f"Estadísticas de captura: {grabber.get_stats()}")
         if hasattr(self, 'capture') and self.capture and self.capture.isOpened():
             self.capture.release()
             print("Cámara liberada correctamente")
 
+    def set_recognizer(self, recognizer):
+        """
+        Sustituye el reconocedor en memoria por uno ya entrenado, sin releerlo
+        desde disco
+        Args:
+            recognizer: LBPHFaceRecognizer entrenado
+        """
+        with self.recognizer_lock:
+            self.recognizer = recognizer
+            self.histogram_index = None
+            self.model_loaded = True
+            self.model_status = 'loaded'
+        self._rebuild_histogram_index()
+        print("Modelo en memoria actualizado")
+
     def train_model(self, faces, labels):
         """
         Entrena el modelo con las caras y etiquetas proporcionadas
         Args:
-            faces: Lista de imágenes de rostros
+            faces: Lista de imágenes de rostros de cualquier tamaño
             labels: Lista de etiquetas correspondientes
         Returns:
             bool: True si el entrenamiento fue exitoso
         """
         try:
-            self.recognizer.train(faces, np.array(labels))
+            faces = [self.normalizer.normalize(face) for face in faces]
+            # Reconocedor nuevo en lugar de reentrenar el publicado: el índice
+            # de histogramas puede estar leyéndolo en segundo plano
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.train(faces, np.array(labels))
             os.makedirs("models", exist_ok=True)
-            self.recognizer.save(self.model_path)
-            self.model_loaded = True
+            recognizer.save(self.model_path)
+            write_model_metadata(self.model_path, self.normalizer)
+            with self.recognizer_lock:
+                self.recognizer = recognizer
+                self.histogram_index = None
+                self.model_loaded = True
+                self.model_status = 'loaded'
+            self._rebuild_histogram_index()
             print(f"Modelo entrenado y guardado en {self.model_path}")
             return True
         except Exception as e:
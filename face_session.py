@@ -0,0 +1,186 @@
+import threading
+from kivy.clock import Clock
+
+
+class FaceSession:
+    """
+    Sesión de reconocimiento facial compartida por toda la aplicación.
+    Mantiene cargados el clasificador, el reconocedor y la cámara para que las
+    pantallas los tomen prestados con acquire() y los devuelvan con release().
+    Cuando nadie usa la cámara durante idle_timeout segundos se libera, pero el
+    clasificador y el modelo siguen en memoria. Si el modelo guardado no se
+    puede usar (por ejemplo, uno anterior a los metadatos de preprocesado) se
+    reentrena en segundo plano y se carga al terminar.
+    """
+
+    def __init__(self, idle_timeout=30.0):
+        """
+        Args:
+            idle_timeout: Segundos sin préstamos antes de liberar la cámara
+        """
+        self.idle_timeout = idle_timeout
+        self._face_recognition = None
+        self._leases = 0
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        self._idle_event = None
+        self._rebuild_job = None
+        self._rebuild_callbacks = []
+
+    @property
+    def leases(self):
+        """Número de pantallas que tienen la sesión prestada"""
+        return self._leases
+
+    @property
+    def face_recognition(self):
+        """Instancia compartida o None si aún no se ha creado"""
+        return self._face_recognition
+
+    def warm_up(self):
+        """
+        Crea FaceRecognition en un hilo de fondo para que la primera pantalla
+        de cámara no pague la carga del clasificador, el modelo y la cámara
+        """
+        if self._face_recognition is not None or self._warmup_thread is not None:
+            return
+        self._warmup_thread = threading.Thread(target=self._warm_up, name='FaceSessionWarmUp', daemon=True)
+        self._warmup_thread.start()
+
+    def _create(self):
+        # Importación diferida: OpenCV y el reconocedor no se cargan hasta que
+        # hacen falta (o hasta la precarga en segundo plano)
+        from face_recognition import FaceRecognition
+        return FaceRecognition()
+
+    def _check_model(self, face_recognition):
+        # Llamado ya fuera del cerrojo, con la instancia publicada
+        if face_recognition.model_status == 'needs_rebuild':
+            self.rebuild_model()
+
+    @property
+    def rebuilding(self):
+        """True mientras se reentrena el modelo en segundo plano"""
+        return self._rebuild_job is not None
+
+    def rebuild_model(self, on_complete=None):
+        """
+        Reentrena el modelo completo en segundo plano (una sola vez aunque se
+        pida varias) y lo carga en la instancia compartida al terminar
+        Args:
+            on_complete: Callback opcional on_complete(ok), llamado en el hilo de Kivy
+        """
+        from train_faces import TrainingJob
+        with self._lock:
+            if on_complete:
+                self._rebuild_callbacks.append(on_complete)
+            if self._rebuild_job is not None:
+                return
+            self._rebuild_job = TrainingJob(
+                None,
+                on_complete=lambda recognizer, error: Clock.schedule_once(
+                    lambda dt: self._on_rebuild_complete(recognizer))
+            )
+            job = self._rebuild_job
+        print("Reentrenando el modelo facial en segundo plano...")
+        job.start()
+
+    def add_rebuild_callback(self, on_complete):
+        """
+        Registra on_complete(ok) para la reconstrucción en curso
+        Returns:
+            bool: False si no hay ninguna en curso
+        """
+        with self._lock:
+            if self._rebuild_job is None:
+                return False
+            self._rebuild_callbacks.append(on_complete)
+            return True
+
+    def _on_rebuild_complete(self, recognizer):
+        with self._lock:
+            self._rebuild_job = None
+            callbacks, self._rebuild_callbacks = self._rebuild_callbacks, []
+            face_recognition = self._face_recognition
+        if recognizer is not None and face_recognition is not None:
+            face_recognition.set_recognizer(recognizer)
+        for callback in callbacks:
+            callback(recognizer is not None)
+
+    def _warm_up(self):
+        try:
+            face_recognition = self._create()
+        except Exception as e:
+            print(f"Error precargando reconocimiento facial: {str(e)}")
+            return
+        with self._lock:
+            self._face_recognition = face_recognition
+        print("Reconocimiento facial precargado")
+        self._check_model(face_recognition)
+        # Si nadie la usa, liberar la cámara tras el tiempo de inactividad
+        Clock.schedule_once(lambda dt: self._schedule_idle_release())
+
+    def wait_warm_up(self, timeout=None):
+        """Espera a que termine la precarga en curso, si la hay"""
+        thread = self._warmup_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def acquire(self):
+        """
+        Toma prestada la instancia compartida, abriendo la cámara si hace falta
+        Returns:
+            FaceRecognition: Instancia lista para usar
+        """
+        self.wait_warm_up()
+        self._cancel_idle_release()
+        created = False
+        with self._lock:
+            if self._face_recognition is None:
+                self._face_recognition = self._create()
+                created = True
+            else:
+                self._face_recognition.open_camera()
+            self._leases += 1
+            face_recognition = self._face_recognition
+        if created:
+            self._check_model(face_recognition)
+        return face_recognition
+
+    def release(self, face_recognition=None):
+        """
+        Devuelve el préstamo; la cámara se libera tras idle_timeout sin uso
+        Args:
+            face_recognition: Instancia devuelta (solo para comprobación)
+        """
+        with self._lock:
+            if face_recognition is not None and face_recognition is not self._face_recognition:
+                return
+            self._leases = max(0, self._leases - 1)
+        self._schedule_idle_release()
+
+    def _schedule_idle_release(self):
+        if self._leases > 0 or self._face_recognition is None:
+            return
+        self._cancel_idle_release()
+        self._idle_event = Clock.schedule_once(lambda dt: self._release_idle_camera(), self.idle_timeout)
+
+    def _cancel_idle_release(self):
+        if self._idle_event is not None:
+            self._idle_event.cancel()
+            self._idle_event = None
+
+    def _release_idle_camera(self):
+        self._idle_event = None
+        with self._lock:
+            if self._leases == 0 and self._face_recognition is not None:
+                self._face_recognition.release_camera()
+
+    def shutdown(self):
+        """Libera la cámara inmediatamente; usado al cerrar la aplicación"""
+        self._cancel_idle_release()
+        self.wait_warm_up()
+        with self._lock:
+            if self._face_recognition is not None:
+                self._face_recognition.release_camera()
+            self._leases = 0
@@ -0,0 +1,189 @@
+import os
+import time
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class _PacedSource:
+    """
+    Base de las fuentes de frames que sustituyen a la cámara.
+    Implementan la parte de la interfaz de cv2.VideoCapture que usan
+    FrameGrabber y FaceRecognition (read, isOpened, set, get, release) y,
+    con fps, entregan los frames al ritmo de una cámara real en lugar de lo
+    más rápido posible.
+    """
+
+    def __init__(self, fps=None):
+        self.fps = fps
+        self._next_frame_at = None
+        self._opened = True
+
+    def _pace(self):
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self._next_frame_at is not None and now < self._next_frame_at:
+            time.sleep(self._next_frame_at - now)
+            now = self._next_frame_at
+        self._next_frame_at = now + 1.0 / self.fps
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        self._pace()
+        frame = self._next_frame()
+        return (frame is not None), frame
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        # La resolución de una fuente grabada o sintética no se puede cambiar
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        return 0.0
+
+    def release(self):
+        self._opened = False
+
+
+class ReplaySource(_PacedSource):
+    """Reproduce un vídeo grabado o un directorio de imágenes como si fuera la cámara"""
+
+    def __init__(self, path, loop=True, fps=None):
+        """
+        Args:
+            path: Archivo de vídeo o directorio con imágenes (en orden alfabético)
+            loop: Si es True vuelve al principio al terminar
+            fps: Frames por segundo a simular; None entrega sin esperas
+        """
+        super().__init__(fps)
+        self.path = path
+        self.loop = loop
+        self._video = None
+        self._images = None
+        self._position = 0
+        if os.path.isdir(path):
+            self._images = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self._opened = bool(self._images)
+        else:
+            self._video = cv2.VideoCapture(path)
+            self._opened = self._video.isOpened()
+
+    def _next_frame(self):
+        if self._images is not None:
+            if self._position >= len(self._images):
+                if not self.loop:
+                    return None
+                self._position = 0
+            frame = cv2.imread(self._images[self._position])
+            self._position += 1
+            return frame
+        ret, frame = self._video.read()
+        if not ret and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._video.read()
+        return frame if ret else None
+
+    def release(self):
+        super().release()
+        if self._video is not None:
+            self._video.release()
+
+
+class SyntheticSource(_PacedSource):
+    """
+    Genera frames sin cámara: un fondo con ruido y uno o varios rostros
+    esquemáticos que se desplazan y cambian ligeramente de tamaño. Con la
+    misma semilla la secuencia es siempre la misma.
+    """
+
+    def __init__(self, width=640, height=480, faces=1, fps=None, seed=0):
+        """
+        Args:
+            width, height: Resolución de los frames
+            faces: Número de rostros por frame
+            fps: Frames por segundo a simular; None entrega sin esperas
+            seed: Semilla del generador
+        """
+        super().__init__(fps)
+        self.width = width
+        self.height = height
+        self.faces = faces
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._frame_index = 0
+        self._background = self._rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return super().get(prop)
+
+    def _next_frame(self):
+        frame = self._background.copy()
+        t = self._frame_index / 30.0
+        for i in range(self.faces):
+            size = int(min(self.width, self.height) * (0.35 + 0.05 * np.sin(t + i)))
+            cx = int(self.width * (i + 1) / (self.faces + 1) + self.width * 0.05 * np.sin(0.7 * t + i))
+            cy = int(self.height / 2 + self.height * 0.05 * np.cos(0.5 * t + i))
+            draw_face(frame, cx, cy, size, tone=self.seed + i)
+        noise = self._rng.integers(-8, 9, frame.shape, dtype=np.int16)
+        self._frame_index += 1
+        return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def draw_face(image, cx, cy, size, tone=0):
+    """
+    Dibuja un rostro esquemático (óvalo, cejas, ojos, nariz y boca)
+    Args:
+        image: Imagen BGR sobre la que dibujar
+        cx, cy: Centro del rostro
+        size: Alto aproximado del rostro en píxeles
+        tone: Variación de color y proporciones (por ejemplo, un ID de usuario)
+    """
+    rng = np.random.default_rng(tone)
+    skin = tuple(int(v) for v in rng.integers(120, 210, 3))
+    eye_gap = 0.16 + 0.04 * rng.random()
+    cv2.ellipse(image, (cx, cy), (int(size * 0.4), int(size * 0.52)), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        ex, ey = cx + int(side * size * eye_gap), cy - int(size * 0.12)
+        cv2.ellipse(image, (ex, ey - int(size * 0.09)), (int(size * 0.11), int(size * 0.025)),
+                    0, 0, 360, (40, 50, 60), -1)
+        cv2.ellipse(image, (ex, ey), (int(size * 0.08), int(size * 0.04)), 0, 0, 360, (30, 30, 30), -1)
+    cv2.ellipse(image, (cx, cy + int(size * 0.08)), (int(size * 0.04), int(size * 0.1)),
+                0, 0, 360, tuple(max(0, c - 30) for c in skin), -1)
+    cv2.ellipse(image, (cx, cy + int(size * 0.28)), (int(size * (0.1 + 0.06 * rng.random())), int(size * 0.035)),
+                0, 0, 360, (60, 60, 120), -1)
+
+
+def open_frame_source(spec, fps=30):
+    """
+    Abre una fuente de frames a partir de su descripción
+    Args:
+        spec: Índice de cámara (int o '0'), 'synthetic' / 'synthetic:640x480',
+            o la ruta de un vídeo o de un directorio de imágenes
+        fps: Ritmo simulado para las fuentes que no son cámara
+    Returns:
+        Objeto con la interfaz de cv2.VideoCapture
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return cv2.VideoCapture(int(spec))
+    if spec == 'synthetic' or spec.startswith('synthetic:'):
+        width, height = 640, 480
+        if ':' in spec:
+            width, height = (int(v) for v in spec.split(':', 1)[1].lower().split('x'))
+        return SyntheticSource(width, height, fps=fps)
+    if not os.path.exists(spec):
+        raise Exception(f"Fuente de frames no encontrada: {spec}")
+    return ReplaySource(spec, fps=fps)
@@ -0,0 +1,183 @@
+import threading
+import cv2
+import numpy as np
+
+
+def _transpose_in_order(histograms, order, block_size=64):
+    """
+    Copia los histogramas indicados por order como columnas de una matriz
+    (d, n) float32, bloque a bloque
+    Args:
+        histograms: Matriz (n, d) o lista de histogramas; las entradas de una
+            lista se sustituyen por None tras copiarlas
+        order: Índices de los histogramas en el orden de las columnas
+        block_size: Histogramas copiados por bloque (limita la memoria temporal)
+    """
+    n = len(order)
+    d = np.asarray(histograms[0]).size
+    matrix_t = np.empty((d, n), dtype=np.float32)
+    release = isinstance(histograms, list)
+    for start in range(0, n, block_size):
+        block = order[start:start + block_size]
+        if release:
+            rows = np.stack([np.asarray(histograms[i], dtype=np.float32).reshape(-1) for i in block])
+            for i in block:
+                histograms[i] = None
+        else:
+            rows = np.asarray(histograms[block], dtype=np.float32).reshape(len(block), d)
+        matrix_t[:, start:start + len(block)] = rows.T
+    return matrix_t
+
+
+class HistogramIndex:
+    """
+    Búsqueda del vecino más cercano sobre los histogramas LBPH de un modelo.
+    Los histogramas de entrenamiento se copian, por bloques y ordenados por
+    etiqueta, a una única matriz NumPy reservada de antemano (sin copias
+    intermedias del modelo completo), y cada consulta se resuelve con distancias
+    vectorizadas por bloques en lugar de comparar uno a uno como
+    LBPHFaceRecognizer.predict. Con metric='chisqr' la distancia es la misma
+    que usa OpenCV (HISTCMP_CHISQR_ALT), así que predict() devuelve la misma
+    pareja (label, confidence) y los umbrales actuales siguen valiendo.
+    Opcionalmente se compara primero con el centroide de cada usuario y solo
+    se busca entre las muestras de los centroid_candidates más cercanos.
+    """
+
+    METRICS = ('chisqr', 'l2')
+
+    def __init__(self, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8,
+                 metric='chisqr', centroid_candidates=None, chunk_size=2048):
+        """
+        Args:
+            histograms: Matriz (n, d) o lista de histogramas LBPH; una lista
+                se vacía a medida que se copia para liberar cada histograma
+            labels: Etiqueta de cada histograma
+            radius, neighbors, grid_x, grid_y: Parámetros LBPH del modelo
+            metric: 'chisqr' (como OpenCV) o 'l2' (más rápida, otra escala)
+            centroid_candidates: Usuarios a revisar tras comparar centroides;
+                None busca en todas las muestras
+            chunk_size: Muestras por bloque al calcular distancias
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"Métrica no soportada: {metric}")
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        order = np.argsort(labels, kind='stable')
+        # Guardada traspuesta (d, n): las columnas que usa cada consulta son
+        # filas contiguas de memoria
+        self.matrix_t = _transpose_in_order(histograms, order)
+        self.labels = labels[order]
+        self.unique_labels, self.starts = np.unique(self.labels, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.labels))
+
+        self.metric = metric
+        self.centroid_candidates = centroid_candidates
+        self.chunk_size = chunk_size
+        self.sums, self.sq_norms = self._row_stats(self.matrix_t)
+        self.centroids_t = None
+        if centroid_candidates:
+            self.centroids_t = np.ascontiguousarray(np.stack([
+                self.matrix_t[:, start:end].mean(axis=1) for start, end in zip(self.starts, self.ends)
+            ], axis=1))
+            self.centroid_sums, self.centroid_sq_norms = self._row_stats(self.centroids_t)
+
+        # Reconocedor auxiliar con los mismos parámetros para extraer el
+        # histograma de la imagen de consulta exactamente igual que OpenCV
+        self._extractor = cv2.face.LBPHFaceRecognizer_create(radius, neighbors, grid_x, grid_y)
+        self._extractor_lock = threading.Lock()
+        self._dummy_label = np.zeros(1, dtype=np.int32)
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs):
+        """Construye el índice a partir de un LBPHFaceRecognizer entrenado"""
+        # getHistograms() devuelve una tupla; la lista deja liberar cada
+        # histograma en cuanto se ha copiado a la matriz del índice
+        histograms = list(recognizer.getHistograms())
+        if len(histograms) == 0:
+            raise ValueError("El modelo no tiene histogramas de entrenamiento")
+        return cls(
+            histograms,
+            recognizer.getLabels(),
+            radius=recognizer.getRadius(),
+            neighbors=recognizer.getNeighbors(),
+            grid_x=recognizer.getGridX(),
+            grid_y=recognizer.getGridY(),
+            **kwargs
+        )
+
+    @property
+    def nbytes(self):
+        """Memoria de la matriz de histogramas"""
+        return self.matrix_t.nbytes
+
+    def __len__(self):
+        return len(self.labels)
+
+    def histogram(self, face):
+        """Histograma LBPH espacial de una imagen de rostro en escala de grises"""
+        with self._extractor_lock:
+            self._extractor.train([face], self._dummy_label)
+            return self._extractor.getHistograms()[0].reshape(-1).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _row_stats(matrix_t):
+        return matrix_t.sum(axis=0, dtype=np.float64), np.einsum('ij,ij->j', matrix_t, matrix_t)
+
+    def _distances(self, columns_t, query, sums, sq_norms):
+        """Distancia de query a cada columna de columns_t (d, m)"""
+        if self.metric == 'l2':
+            # ||a - q||² = ||a||² - 2 a·q + ||q||²
+            d2 = sq_norms - 2.0 * (query @ columns_t) + float(query @ query)
+            return np.sqrt(np.maximum(d2, 0.0))
+        # Chi-cuadrado alternativa de OpenCV: 2 * Σ (a - q)² / (a + q).
+        # Donde q es 0 el término vale a, así que esa parte sale de la suma de
+        # cada columna y solo hay que recorrer los bins no nulos de la consulta
+        nonzero = np.flatnonzero(query)
+        q = query[nonzero][:, None]
+        out = np.empty(columns_t.shape[1], dtype=np.float64)
+        for start in range(0, columns_t.shape[1], self.chunk_size):
+            block = columns_t[nonzero, start:start + self.chunk_size]
+            outside = sums[start:start + block.shape[1]] - block.sum(axis=0, dtype=np.float64)
+            diff = block - q
+            np.square(diff, out=diff)
+            block += q
+            diff /= block
+            out[start:start + block.shape[1]] = 2.0 * (outside + diff.sum(axis=0, dtype=np.float64))
+        return out
+
+    def _nearest(self, start, end, query):
+        distances = self._distances(self.matrix_t[:, start:end], query,
+                                    self.sums[start:end], self.sq_norms[start:end])
+        i = int(np.argmin(distances))
+        return int(self.labels[start + i]), float(distances[i])
+
+    def search(self, query):
+        """
+        Args:
+            query: Histograma LBPH de la imagen de consulta
+        Returns:
+            tuple: (label, distancia) del histograma de entrenamiento más cercano
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if self.centroids_t is None or len(self.unique_labels) <= self.centroid_candidates:
+            return self._nearest(0, len(self.labels), query)
+
+        # Búsqueda gruesa por centroides y exacta solo en los usuarios candidatos
+        centroid_distances = self._distances(self.centroids_t, query,
+                                             self.centroid_sums, self.centroid_sq_norms)
+        candidates = np.argpartition(centroid_distances, self.centroid_candidates - 1)[:self.centroid_candidates]
+        best_label, best_distance = -1, float('inf')
+        for c in candidates:
+            label, distance = self._nearest(self.starts[c], self.ends[c], query)
+            if distance < best_distance:
+                best_label, best_distance = label, distance
+        return best_label, best_distance
+
+    def predict(self, face):
+        """
+        Mismo contrato que LBPHFaceRecognizer.predict
+        Args:
+            face: Imagen de rostro en escala de grises
+        Returns:
+            tuple: (label, confidence); menor confianza es mejor
+        """
+        return self.search(self.histogram(face))
@@ -0,0 +1,206 @@
+import os
+import shutil
+from kivy.clock import Clock
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.image import Image
+from kivy.uix.label import Label
+from kivy.uix.popup import Popup
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from thumbnails import get_thumbnail_cache
+
+MESSAGE_ROW_HEIGHT = 40
+FILE_ROW_HEIGHT = 80
+PLACEHOLDER_COLOR = (0.3, 0.3, 0.3, 1)
+
+
+class _PagedSource:
+    """Lee páginas de una consulta paginada de AuthSystem bajo demanda"""
+
+    def __init__(self, fetch_page, user_id, page_size):
+        self.fetch_page = fetch_page
+        self.user_id = user_id
+        self.page_size = page_size
+        self.rows = []
+        self.cursor = None
+        self.exhausted = False
+
+    def peek(self):
+        if not self.rows and not self.exhausted:
+            self.rows, self.cursor = self.fetch_page(self.user_id, self.page_size, self.cursor)
+            self.rows.reverse()  # Se consumen desde el final de la lista
+            if self.cursor is None:
+                self.exhausted = True
+        return self.rows[-1] if self.rows else None
+
+    def pop(self):
+        return self.rows.pop()
+
+
+class InboxStream:
+    """
+    Mezcla los mensajes y los archivos recibidos en un único flujo ordenado del
+    más reciente al más antiguo, pidiendo a la base de datos solo las páginas
+    que hacen falta.
+    """
+
+    def __init__(self, auth, user_id, page_size=50):
+        self.page_size = page_size
+        self._messages = _PagedSource(auth.get_messages_page, user_id, page_size)
+        self._files = _PagedSource(auth.get_files_page, user_id, page_size)
+
+    @property
+    def has_more(self):
+        return self._messages.peek() is not None or self._files.peek() is not None
+
+    def next_page(self):
+        """
+        Returns:
+            list: Hasta page_size filas de datos para InboxRow
+        """
+        items = []
+        while len(items) < self.page_size:
+            message = self._messages.peek()
+            file = self._files.peek()
+            if message is None and file is None:
+                break
+            # Los timestamps de SQLite ('YYYY-MM-DD HH:MM:SS') se ordenan como texto
+            if file is None or (message is not None and message[2] >= file[2]):
+                sender, text, time = self._messages.pop()
+                items.append({
+                    'kind': 'message',
+                    'text': f"{time} - {sender}: {text}",
+                    'path': '',
+                    'file_name': '',
+                    'content_key': None,
+                    'height': MESSAGE_ROW_HEIGHT,
+                })
+            else:
+                sender, path, time, file_name, blob_hash = self._files.pop()
+                file_name = file_name or os.path.basename(path)
+                items.append({
+                    'kind': 'file',
+                    'text': f"{time} - {sender} envió: {file_name}",
+                    'path': path,
+                    'file_name': file_name,
+                    'content_key': blob_hash,
+                    'height': FILE_ROW_HEIGHT,
+                })
+        return items
+
+
+def show_full_image(path, title=None):
+    """Abre la imagen original en un popup"""
+    popup_img = Image(source=path, allow_stretch=True, keep_ratio=True)
+    popup_layout = BoxLayout(orientation='vertical')
+    popup_layout.add_widget(popup_img)
+    close_btn = Button(text="Cerrar", size_hint_y=None, height=50)
+    popup_layout.add_widget(close_btn)
+    popup = Popup(title=title or os.path.basename(path), content=popup_layout, size_hint=(0.9, 0.9))
+    close_btn.bind(on_press=popup.dismiss)
+    popup.open()
+
+
+def download_image(path, file_name=None):
+    """Copia la imagen a la carpeta downloads con su nombre original"""
+    try:
+        os.makedirs("downloads", exist_ok=True)
+        dest = os.path.join("downloads", file_name or os.path.basename(path))
+        shutil.copy(path, dest)
+        Popup(title="Descargado", content=Label(text=f"Imagen guardada en {dest}"), size_hint=(None, None), size=(400, 200)).open()
+    except Exception as e:
+        Popup(title="Error", content=Label(text=f"No se pudo descargar: {str(e)}"), size_hint=(None, None), size=(400, 200)).open()
+
+
+class InboxRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila reutilizable de la bandeja: un mensaje o una imagen recibida"""
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', spacing=10, **kwargs)
+        self.kind = None
+        self.path = ''
+        self.file_name = ''
+
+        self.thumbnail = Image(size_hint_x=None, width=80)
+        self.text_label = Label(halign="left", valign="middle")
+        self.text_label.bind(size=self.text_label.setter('text_size'))
+        self.download_btn = Button(text="Descargar", size_hint_x=None, width=120)
+        self.download_btn.bind(on_press=lambda instance: download_image(self.path, self.file_name))
+
+        self.add_widget(self.thumbnail)
+        self.add_widget(self.text_label)
+        self.add_widget(self.download_btn)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.kind = data['kind']
+        self.path = data['path']
+        self.file_name = data['file_name']
+        is_file = self.kind == 'file'
+        exists = is_file and os.path.exists(self.path)
+
+        self.text_label.text = data['text'] if exists or not is_file else f"(No encontrada) {data['text']}"
+        self._show_thumbnail(None)
+        if exists:
+            # La original solo se abre al ver la imagen completa (o al generar
+            # la miniatura); el hash del almacén evita leerla para buscarla
+            thumb_path = get_thumbnail_cache().request(self.path, self._on_thumbnail_ready,
+                                                       key=data.get('content_key'))
+            if thumb_path:
+                self._show_thumbnail(thumb_path)
+        self.thumbnail.width = 80 if is_file else 0
+        self.thumbnail.opacity = 1 if exists else 0
+        self.download_btn.width = 120 if exists else 0
+        self.download_btn.opacity = 1 if exists else 0
+        self.download_btn.disabled = not exists
+        return super().refresh_view_attrs(rv, index, data)
+
+    def _show_thumbnail(self, thumb_path):
+        # Sin miniatura se muestra un recuadro gris como marcador de posición
+        self.thumbnail.source = thumb_path or ''
+        self.thumbnail.color = (1, 1, 1, 1) if thumb_path else PLACEHOLDER_COLOR
+
+    def _on_thumbnail_ready(self, path, thumb_path):
+        # Llamado desde un hilo de fondo; la fila puede haberse reciclado entretanto
+        def apply(dt):
+            if self.path == path and thumb_path:
+                self._show_thumbnail(thumb_path)
+        Clock.schedule_once(apply)
+
+    def on_touch_down(self, touch):
+        if self.kind == 'file' and self.thumbnail.opacity and self.thumbnail.collide_point(*touch.pos):
+            show_full_image(self.path, self.file_name)
+            return True
+        return super().on_touch_down(touch)
+
+
+class InboxView(RecycleView):
+    """
+    Lista virtualizada de la bandeja de entrada. Solo existen los widgets de
+    las filas visibles y se cargan más filas al acercarse al final.
+    """
+
+    def __init__(self, auth, user_id, page_size=50, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = InboxRow
+        layout = RecycleBoxLayout(orientation='vertical', spacing=15, padding=[10, 10, 10, 10],
+                                  default_size=(None, FILE_ROW_HEIGHT), default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+
+        self.stream = InboxStream(auth, user_id, page_size)
+        self.bind(scroll_y=self._on_scroll)
+        self.load_more()
+
+    def load_more(self):
+        """Añade la siguiente página del flujo a los datos de la vista"""
+        if not self.stream.has_more:
+            return
+        self.data.extend(self.stream.next_page())
+
+    def _on_scroll(self, instance, scroll_y):
+        # scroll_y llega a 0 al final de la lista
+        if scroll_y < 0.1:
+            self.load_more()
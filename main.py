@@ -1,4 +1,11 @@
+import os
+import sys
+import time
+import threading
+import importlib
+_IMPORTS_STARTED = time.perf_counter()
 from kivy.app import App
+from kivy.core.window import Window
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.uix.button import Button
@@ -7,13 +14,35 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.image import Image
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.clock import Clock
-from kivy.uix.filechooser import FileChooserIconView
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
-import os
-import shutil
 from auth import AuthSystem
-from face_recognition import FaceRecognition
+from database import get_database
+from write_queue import close_write_queues
+from face_session import FaceSession
+from face_decision import DecisionEngine
+from startup_report import StartupReport
+# OpenCV, NumPy, el reconocedor, el entrenamiento y el selector de archivos se
+# importan al construir la pantalla que los usa o durante la precarga
+_IMPORTS_DONE = time.perf_counter()
+
+# Módulos pesados que la precarga importa en segundo plano tras el primer frame
+PREWARM_MODULES = ('cv2', 'numpy', 'face_recognition', 'train_faces', 'thumbnails', 'upload_store')
+# Pantallas que la precarga construye, una por frame, tras el primer frame
+PREWARM_SCREENS = ('face_login', 'register', 'main', 'face_enrollment')
+
+
+def show_metrics_overlay(screen):
+    """
+    Arranca la superposición de métricas de una pantalla con cámara si las
+    métricas están activas, creándola la primera vez (también si se activaron
+    en caliente)
+    """
+    if not screen.metrics.enabled:
+        return
+    if screen.overlay is None:
+        from pipeline_metrics import MetricsOverlay
+        screen.overlay = MetricsOverlay(screen.metrics)
+        screen.add_widget(screen.overlay)
+    screen.overlay.start()
 
 
 # -------------------- LOGIN --------------------
@@ -118,51 +147,143 @@ class FaceLoginScreen(Screen):
         self.layout.add_widget(self.back_btn)
 
         self.add_widget(self.layout)
+        self.auth = AuthSystem()
         self.face_event = None
         self.face_recognition = None
+        self.recognition_worker = None
+        self.decision_engine = DecisionEngine()
+        self.last_results = []
+
+        # Métricas del pipeline superpuestas en la vista previa (FACE_METRICS=1 o F12)
+        from pipeline_metrics import get_metrics
+        self.metrics = get_metrics()
+        self.overlay = None
 
     def on_enter(self):
         try:
-            self.face_recognition = FaceRecognition()
+            from face_recognition import RecognitionWorker
+            self.face_recognition = App.get_running_app().face_session.acquire()
+            self.face_recognition.reset_tracking()
+            self.recognition_worker = RecognitionWorker(self.face_recognition)
+            self.metrics.register_provider('worker', self.recognition_worker.get_stats)
+            show_metrics_overlay(self)
+            self.decision_engine.reset()
+            self.last_results = []
             self.face_event = Clock.schedule_interval(self.update, 1.0 / 30.0)
-            self.status_label.text = "Cámara iniciada correctamente"
+            self._show_model_status()
         except Exception as e:
             self.status_label.text = f"Error: {str(e)}"
             if self.face_event:
                 self.face_event.cancel()
 
+    def _show_model_status(self):
+        # Sin modelo usable no se reconoce nada: decirlo en lugar de esperar
+        session = App.get_running_app().face_session
+        if session.rebuilding and session.add_rebuild_callback(self._on_model_rebuilt):
+            self.status_label.text = "Actualizando el modelo facial, espere..."
+        elif self.face_recognition.model_loaded:
+            self.status_label.text = "Cámara iniciada correctamente"
+        elif self.face_recognition.model_status == 'missing':
+            self.status_label.text = "No hay rostros registrados todavía"
+        else:
+            self.status_label.text = "El modelo facial no se pudo cargar"
+
+    def _on_model_rebuilt(self, ok):
+        if not self.manager or self.manager.current != self.name:
+            return
+        if ok:
+            self.status_label.text = "Mire a la cámara para reconocimiento facial"
+        else:
+            self.status_label.text = "No se pudo actualizar el modelo facial"
+
     def update(self, dt):
         if not self.face_recognition:
             return
 
-        ret, frame = self.face_recognition.capture.read()
-        if ret:
-            if self.face_recognition.model_loaded:
-                face_id = self.face_recognition.detect_faces(frame)
-                if face_id is not None:
-                    auth = AuthSystem()
-                    user = auth.login_with_face(face_id)
-                    if user:
-                        main_screen = self.manager.get_screen('main')
-                        main_screen.current_user = user
-                        self.manager.current = 'main'
-                        return
+        frame = self.face_recognition.latest_frame()
+        if frame is not None:
+            # El reconocimiento va a su ritmo; si está ocupado el worker descarta
+            # el frame (y lo cuenta) y si ya se ha decidido solo se muestra
+            if self.face_recognition.model_loaded and not self.decision_engine.decided:
+                self.recognition_worker.submit(frame, self._on_recognition_done, copy=True)
 
+            self.face_recognition.draw_results(frame, self.last_results)
             texture = self.face_recognition.frame_to_texture(frame)
             if texture:
+                # La textura se reutiliza entre frames: pedir el redibujado
                 self.image.texture = texture
+                self.image.canvas.ask_update()
+                self.metrics.tick('preview')
+
+    def _on_recognition_done(self, future):
+        # Se ejecuta en el hilo del worker: pasar el resultado al hilo de Kivy
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.metrics.count('recognition_errors')
+            return
+        results = future.result()
+        Clock.schedule_once(lambda dt: self._handle_results(results))
+
+    def _handle_results(self, results):
+        if not self.manager or self.manager.current != self.name:
+            # Resultado que llega después de salir de la pantalla
+            self.metrics.count('results_discarded')
+            return
+        self.last_results = results
+        self.metrics.tick('recognition')
+        if self.decision_engine.decided:
+            return
+        decision = self.decision_engine.add(results)
+        if decision is None:
+            return
+
+        print(f"Decisión de reconocimiento en {decision.elapsed:.2f}s "
+              f"({decision.frames} frames): {decision.label}")
+        self.metrics.record('decision', decision.elapsed)
+        with self.metrics.stage('auth_lookup'):
+            user = self.auth.login_with_face(decision.label) if decision.label is not None else None
+        if user:
+            main_screen = self.manager.get_screen('main')
+            main_screen.current_user = user
+            self.manager.current = 'main'
+        else:
+            # Rechazado: avisar y volver a intentarlo pasado un momento
+            self.status_label.text = "Rostro no reconocido"
+            Clock.schedule_once(lambda dt: self._retry_recognition(), 2.0)
+
+    def _retry_recognition(self):
+        if self.manager and self.manager.current == self.name:
+            self.decision_engine.reset()
+            self.status_label.text = "Mire a la cámara para reconocimiento facial"
 
     def on_leave(self):
         if self.face_event:
             self.face_event.cancel()
+        if self.overlay:
+            self.overlay.stop()
+        if self.recognition_worker:
+            self.metrics.unregister_provider('worker')
+            self.recognition_worker.stop()
+            self.recognition_worker = None
         if self.face_recognition:
-            self.face_recognition.release_camera()
+            App.get_running_app().face_session.release(self.face_recognition)
+            self.face_recognition = None
 
     def go_to_login(self, instance):
         self.manager.current = 'login'
 
 
 # -------------------- FACE regis --------------------
+# Indicaciones al usuario según el motivo por el que se descartó la última muestra
+QUALITY_HINTS = {
+    'blur': "Imagen borrosa: quédese quieto",
+    'dark': "Poca luz: busque una zona más iluminada",
+    'bright': "Demasiada luz frente a la cámara",
+    'clipped': "Iluminación irregular en el rostro",
+    'duplicate': "Gire ligeramente la cabeza o cambie de expresión",
+}
+
 class FaceEnrollmentScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -188,14 +309,22 @@ class FaceEnrollmentScreen(Screen):
 
         self.face_recognition = None
         self.capture_event = None
+        self.training_job = None
+        self.enrollment = None
         self.capturing = False
         self.samples_captured = 0
         self.total_samples = 5
 
+        from pipeline_metrics import get_metrics
+        self.metrics = get_metrics()
+        self.overlay = None
+
     def on_enter(self):
         try:
-            self.face_recognition = FaceRecognition()
+            self.face_recognition = App.get_running_app().face_session.acquire()
+            self.face_recognition.reset_tracking()
             self.capture_event = Clock.schedule_interval(self.update_camera, 1.0 / 30.0)
+            show_metrics_overlay(self)
         except Exception as e:
             self.show_error(f"No se pudo iniciar la cámara: {str(e)}")
             self.status_label.text = "Error de cámara"
@@ -203,15 +332,37 @@ class FaceEnrollmentScreen(Screen):
     def on_leave(self):
         if self.capture_event:
             self.capture_event.cancel()
+        if self.overlay:
+            self.overlay.stop()
+        # Con las muestras ya confirmadas (o confirmándose) el registro termina
+        # en segundo plano; si no, el modelo no las incluiría
+        if self.enrollment:
+            self.enrollment.cancel()
+            if self.enrollment.state == 'saving':
+                self._finish_saving(self.enrollment)
+            self.enrollment = None
+            self.reset_capture_state()
+        if self.training_job:
+            self.training_job = None
+            self.reset_capture_state()
         if self.face_recognition:
-            self.face_recognition.release_camera()
+            App.get_running_app().face_session.release(self.face_recognition)
+            self.face_recognition = None
 
     def update_camera(self, dt):
-        ret, frame = self.face_recognition.capture.read()
-        if ret:
+        frame = self.face_recognition.latest_frame()
+        if self.enrollment:
+            # Un paso de captura por tick; marca el rostro aceptado en el frame
+            with self.metrics.stage('enrollment_step'):
+                progress = self.enrollment.step(frame)
+            self._on_capture_progress(progress)
+        if frame is not None:
             texture = self.face_recognition.frame_to_texture(frame)
             if texture:
+                # La textura se reutiliza entre frames: pedir el redibujado
                 self.image.texture = texture
+                self.image.canvas.ask_update()
+                self.metrics.tick('preview')
 
     def start_capture(self, instance):
         if self.capturing:
@@ -222,38 +373,95 @@ class FaceEnrollmentScreen(Screen):
             self.show_error("No se ha especificado un nombre de usuario")
             return
 
-        user = self.auth.cursor.execute(
-            'SELECT id FROM users WHERE username=?', (username,)
-        ).fetchone()
-
-        if not user:
+        user_id = self.auth.get_user_id(username)
+        if user_id is None:
             self.show_error("Usuario no encontrado en la base de datos")
             return
 
-        user_id = user[0]
         self.capturing = True
         self.start_btn.disabled = True
         self.status_label.text = "Capturando muestras de su rostro..."
         self.progress_label.text = f"Progreso: 0/{self.total_samples}"
 
-        Clock.schedule_once(lambda dt: self._capture_samples(user_id))
-
-    def _capture_samples(self, user_id):
-        success = self.face_recognition.capture_face_samples(user_id, self.total_samples)
-        if success:
+        from face_recognition import EnrollmentCapture
+        self.enrollment = EnrollmentCapture(self.face_recognition, user_id, self.total_samples)
+
+    def _on_capture_progress(self, progress):
+        self.samples_captured = progress.accepted
+        if progress.state == 'capturing':
+            self.progress_label.text = (f"Progreso: {progress.accepted}/{progress.samples}"
+                                        f" (descartadas: {progress.rejected})")
+            self.status_label.text = QUALITY_HINTS.get(progress.last_rejection,
+                                                       "Capturando muestras de su rostro...")
+        elif progress.state == 'saving':
+            self.progress_label.text = "Guardando muestras..."
+        elif progress.state == 'done':
+            user_id = self.enrollment.user_id
+            self.enrollment = None
             self.progress_label.text = "Entrenando modelo..."
             self.train_model(user_id)
-        else:
-            self.show_error("No se pudieron capturar suficientes muestras")
+        elif progress.state == 'failed':
+            self.enrollment = None
+            self.show_error(f"No se pudieron capturar suficientes muestras\n{progress.message}")
             self.reset_capture_state()
 
-    def train_model(self, user_id):
-        import subprocess
-        result = subprocess.run(['python', 'train_faces.py'], capture_output=True, text=True)
-        if result.returncode == 0:
-            self.auth.cursor.execute('UPDATE users SET face_id=? WHERE id=?', (user_id, user_id))
-            self.auth.conn.commit()
+    def _finish_saving(self, enrollment):
+        # Sin la pantalla nadie llama a step(): se consulta hasta que termine
+        def poll(dt):
+            progress = enrollment.step(None)
+            if progress.state == 'saving':
+                return
+            if progress.state == 'done':
+                self.train_model(enrollment.user_id, foreground=False)
+            return False
+        Clock.schedule_interval(poll, 0.1)
+
+    def train_model(self, user_id, foreground=True):
+        """
+        Args:
+            foreground: Si es False el resultado se aplica sin actualizar la
+                pantalla (registro que terminó después de salir de ella)
+        """
+        from train_faces import TrainingJob
+        job = TrainingJob(
+            user_id,
+            on_progress=lambda phase, done, total: Clock.schedule_once(
+                lambda dt: self._on_training_progress(job, phase, done, total)),
+            on_complete=lambda recognizer, error: Clock.schedule_once(
+                lambda dt: self._on_training_complete(job, user_id, recognizer, error))
+        )
+        if foreground:
+            self.training_job = job
+        job.start()
+
+    def _on_training_progress(self, job, phase, done, total):
+        if job is not self.training_job:
+            return
+        if phase == 'loading':
+            self.progress_label.text = f"Cargando usuarios: {done}/{total}"
+        elif phase == 'training':
+            self.progress_label.text = "Entrenando modelo..."
+        elif phase == 'saving':
+            self.progress_label.text = "Guardando modelo..."
+
+    def _on_training_complete(self, job, user_id, recognizer, error):
+        if job.cancelled:
+            return
+        if recognizer is not None:
+            face_recognition = App.get_running_app().face_session.face_recognition
+            if face_recognition:
+                face_recognition.set_recognizer(recognizer)
+
+            self.auth.set_face_id(user_id, user_id)
 
+        if job is not self.training_job:
+            # Terminó después de salir de la pantalla
+            if recognizer is None:
+                print(f"Error en entrenamiento del usuario {user_id}: {error}")
+            return
+        self.training_job = None
+
+        if recognizer is not None:
             main_screen = self.manager.get_screen('main')
             user = self.auth.get_user_by_username(self.manager.get_screen('register').username.text)
             main_screen.current_user = user
@@ -290,7 +498,7 @@ class MainScreen(Screen):
         self.welcome_label = Label(text='Bienvenido a la aplicación!', font_size=24)
         self.layout.add_widget(self.welcome_label)
 
-        self.user_input = TextInput(hint_text="Usuario destino", multiline=False)
+        self.user_input = TextInput(hint_text="Usuario destino (varios separados por comas)", multiline=False)
         self.layout.add_widget(self.user_input)
 
         self.msg_input = TextInput(hint_text="Escribe un mensaje", multiline=False)
@@ -318,12 +526,32 @@ class MainScreen(Screen):
         if self.current_user:
             self.welcome_label.text = f"Bienvenido, {self.current_user[1]}!"
 
+    def _receivers(self):
+        # Varios destinatarios separados por comas
+        return [name.strip() for name in self.user_input.text.split(',') if name.strip()]
+
+    def _confirm_write(self, future, success_text, missing):
+        # La escritura se confirma en segundo plano; el aviso vuelve al hilo de Kivy
+        def done(future):
+            error = future.exception()
+            Clock.schedule_once(lambda dt: self._on_write_confirmed(error, success_text, missing))
+        future.add_done_callback(done)
+
+    def _on_write_confirmed(self, error, success_text, missing):
+        if error is not None:
+            self.auth.show_error_popup(f"No se pudo guardar: {error}")
+            return
+        if missing:
+            success_text += f"\nNo encontrados: {', '.join(missing)}"
+        Popup(title="Éxito", content=Label(text=success_text), size_hint=(None, None), size=(400, 200)).open()
+
     def send_message(self, instance):
-        receiver = self.user_input.text.strip()
+        receivers = self._receivers()
         message = self.msg_input.text.strip()
-        if receiver and message:
-            if self.auth.send_message(self.current_user[0], receiver, message):
-                Popup(title="Éxito", content=Label(text="Mensaje enviado"), size_hint=(None, None), size=(400, 200)).open()
+        if receivers and message:
+            future, missing = self.auth.send_message_to_many(self.current_user[0], receivers, message)
+            if future:
+                self._confirm_write(future, "Mensaje enviado", missing)
                 self.msg_input.text = ""
             else:
                 self.auth.show_error_popup("Usuario destino no encontrado")
@@ -331,22 +559,21 @@ class MainScreen(Screen):
             self.auth.show_error_popup("Debes escribir el usuario y el mensaje")
 
     def upload_file(self, instance):
+        from kivy.uix.filechooser import FileChooserIconView
+        from upload_store import get_upload_store
         chooser = FileChooserIconView(filters=['*.png', '*.jpg', '*.jpeg'])
         popup = Popup(title="Seleccionar imagen", content=chooser, size_hint=(0.9, 0.9))
 
         def select_file(instance, selection, touch):  # ← FIX: agregamos touch
             if selection:
                 file_path = selection[0]
-                receiver = self.user_input.text.strip()
-                if receiver:
-                    os.makedirs("uploads", exist_ok=True)
-                    filename = os.path.basename(file_path)
-                    dest_path = os.path.join("uploads", filename)
-                    shutil.copy(file_path, dest_path)
-                    if self.auth.save_file(self.current_user[0], receiver, dest_path):
-                        Popup(title="Éxito", content=Label(text="Imagen enviada"), size_hint=(None, None), size=(400, 200)).open()
-                    else:
-                        self.auth.show_error_popup("Usuario destino no encontrado")
+                receivers = self._receivers()
+                if receivers:
+                    # La copia se hace en segundo plano; el registro vuelve al hilo de Kivy
+                    get_upload_store().store_async(
+                        file_path,
+                        lambda future: Clock.schedule_once(lambda dt: self._on_upload_stored(future, receivers))
+                    )
                 else:
                     self.auth.show_error_popup("Debes escribir el usuario destino")
             popup.dismiss()
@@ -354,81 +581,141 @@ class MainScreen(Screen):
         chooser.bind(on_submit=select_file)
         popup.open()
 
+    def _on_upload_stored(self, future, receivers):
+        if future.exception() is not None:
+            self.auth.show_error_popup(f"No se pudo subir la imagen: {future.exception()}")
+            return
+        from thumbnails import get_thumbnail_cache
+        blob = future.result()
+        write, missing = self.auth.save_file_to_many(self.current_user[0], receivers, blob.path, blob=blob)
+        if write:
+            # Generar la miniatura ya, para que la bandeja no tenga que hacerlo
+            get_thumbnail_cache().request(blob.path, key=blob.hash)
+            self._confirm_write(write, "Imagen enviada", missing)
+        else:
+            self.auth.show_error_popup("Usuario destino no encontrado")
+
     def view_inbox(self, instance):
-        messages = self.auth.get_messages_for_user(self.current_user[0])
-        files = self.auth.get_files_for_user(self.current_user[0])
-
-        layout = GridLayout(cols=1, spacing=15, padding=[10, 10, 10, 10], size_hint_y=None)
-        layout.bind(minimum_height=layout.setter('height'))
-
-        layout.add_widget(Label(text="Mensajes:", font_size=20, bold=True, size_hint_y=None, height=40))
-        for sender, msg, time in messages:
-            lbl = Label(text=f"{time} - {sender}: {msg}", size_hint_y=None, height=40, halign="left", valign="middle")
-            lbl.bind(size=lbl.setter('text_size'))
-            layout.add_widget(lbl)
-
-        layout.add_widget(Label(text="Imágenes:", font_size=20, bold=True, size_hint_y=None, height=40))
-        for sender, path, time in files:
-            row = BoxLayout(orientation='horizontal', size_hint_y=None, height=80, spacing=10)
-
-            if os.path.exists(path):
-                img = Image(source=path, size_hint_x=None, width=80)
-
-                def show_full_image(instance, p=path):
-                    popup_img = Image(source=p, allow_stretch=True, keep_ratio=True)
-                    popup_layout = BoxLayout(orientation='vertical')
-                    popup_layout.add_widget(popup_img)
-                    close_btn = Button(text="Cerrar", size_hint_y=None, height=50)
-                    popup_layout.add_widget(close_btn)
-                    popup = Popup(title=os.path.basename(p), content=popup_layout, size_hint=(0.9, 0.9))
-                    close_btn.bind(on_press=popup.dismiss)
-                    popup.open()
-
-                img.bind(on_touch_down=lambda inst, touch, p=path: show_full_image(inst, p) if inst.collide_point(*touch.pos) else None)
-            else:
-                img = Label(text="(No encontrada)", size_hint_x=None, width=80)
+        # Lista virtualizada: mensajes e imágenes en un solo flujo paginado por fecha
+        from inbox import InboxView
+        inbox = InboxView(self.auth, self.current_user[0], size_hint=(1, 1))
+        Popup(title="Bandeja de entrada", content=inbox, size_hint=(0.9, 0.9)).open()
+
+    def logout(self, instance):
+        self.manager.current = 'login'
 
-            file_label = Label(text=f"{time} - {sender} envió: {os.path.basename(path)}", halign="left", valign="middle")
-            file_label.bind(size=file_label.setter('text_size'))
 
-            download_btn = Button(text="Descargar", size_hint_x=None, width=120)
+# -------------------- APP --------------------
+class LazyScreenManager(ScreenManager):
+    """
+    ScreenManager que construye cada pantalla la primera vez que se navega a
+    ella o se pide con get_screen(), en lugar de crearlas todas al arrancar
+    """
 
-            def download_image(inst, p=path):
-                try:
-                    os.makedirs("downloads", exist_ok=True)
-                    dest = os.path.join("downloads", os.path.basename(p))
-                    shutil.copy(p, dest)
-                    Popup(title="Descargado", content=Label(text=f"Imagen guardada en {dest}"), size_hint=(None, None), size=(400, 200)).open()
-                except Exception as e:
-                    Popup(title="Error", content=Label(text=f"No se pudo descargar: {str(e)}"), size_hint=(None, None), size=(400, 200)).open()
+    def __init__(self, startup=None, **kwargs):
+        super().__init__(**kwargs)
+        self.startup = startup or StartupReport()
+        self._factories = {}
 
-            download_btn.bind(on_press=download_image)
+    def register(self, name, factory):
+        """Registra la clase (o función) que crea la pantalla name"""
+        self._factories[name] = factory
 
-            row.add_widget(img)
-            row.add_widget(file_label)
-            row.add_widget(download_btn)
+    @property
+    def pending_screens(self):
+        """Pantallas registradas que aún no se han construido"""
+        return list(self._factories)
 
-            layout.add_widget(row)
+    def build_screen(self, name):
+        factory = self._factories.pop(name, None)
+        if factory is None:
+            return
+        with self.startup.phase(f'screen:{name}'):
+            self.add_widget(factory(name=name))
 
-        scroll = ScrollView(size_hint=(1, 1))
-        scroll.add_widget(layout)
-        Popup(title="Bandeja de entrada", content=scroll, size_hint=(0.9, 0.9)).open()
+    def get_screen(self, name):
+        if name in self._factories:
+            self.build_screen(name)
+        return super().get_screen(name)
 
-    def logout(self, instance):
-        self.manager.current = 'login'
+    def has_screen(self, name):
+        return name in self._factories or super().has_screen(name)
 
 
-# -------------------- APP --------------------
 class FaceRecognitionApp(App):
     def build(self):
-        sm = ScreenManager()
-        sm.add_widget(LoginScreen(name='login'))
-        sm.add_widget(RegisterScreen(name='register'))
-        sm.add_widget(FaceLoginScreen(name='face_login'))
-        sm.add_widget(FaceEnrollmentScreen(name='face_enrollment'))
-        sm.add_widget(MainScreen(name='main'))
+        self.startup = StartupReport(_IMPORTS_STARTED)
+        self.startup.record('imports', _IMPORTS_STARTED, _IMPORTS_DONE)
+        self.prewarm = os.environ.get('FACE_PREWARM', '1') != '0'
+
+        # Esquema de la base de datos creado una sola vez al arrancar
+        with self.startup.phase('schema'):
+            get_database().ensure_schema()
+
+        # Sesión de cámara compartida; se precarga tras el primer frame
+        self.face_session = FaceSession()
+
+        # Solo la pantalla de login se construye ahora; el resto al navegar
+        sm = LazyScreenManager(self.startup)
+        sm.register('login', LoginScreen)
+        sm.register('register', RegisterScreen)
+        sm.register('face_login', FaceLoginScreen)
+        sm.register('face_enrollment', FaceEnrollmentScreen)
+        sm.register('main', MainScreen)
+        sm.current = 'login'
+
+        Window.bind(on_flip=self._on_first_frame)
+        Window.bind(on_key_down=self._on_key_down)
         return sm
 
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        # F12 activa las métricas del pipeline sin reiniciar la aplicación
+        if key != 293:
+            return False
+        from pipeline_metrics import enable_metrics
+        enable_metrics()
+        screen = self.root.current_screen
+        if hasattr(screen, 'overlay'):
+            show_metrics_overlay(screen)
+        return True
+
+    def _on_first_frame(self, *args):
+        Window.unbind(on_flip=self._on_first_frame)
+        self.startup.mark('first_frame')
+        self.startup.print_report()
+        self.startup.save()
+        if self.prewarm:
+            threading.Thread(target=self._prewarm_background, name='StartupPrewarm', daemon=True).start()
+            Clock.schedule_once(self._prewarm_next_screen)
+
+    def _prewarm_background(self):
+        # Importaciones y cámara fuera del hilo de Kivy
+        for module in PREWARM_MODULES:
+            if module not in sys.modules:
+                with self.startup.phase(f'prewarm:{module}'):
+                    importlib.import_module(module)
+        with self.startup.phase('prewarm:face_session'):
+            self.face_session.warm_up()
+            self.face_session.wait_warm_up()
+        self.startup.save()
+
+    def _prewarm_next_screen(self, dt):
+        # Una pantalla por frame para no congelar la de login
+        pending = [name for name in PREWARM_SCREENS if name in self.root.pending_screens]
+        if pending:
+            self.root.build_screen(pending[0])
+            Clock.schedule_once(self._prewarm_next_screen)
+        else:
+            self.startup.save()
+
+    def on_stop(self):
+        self.face_session.shutdown()
+        if 'pipeline_metrics' in sys.modules:
+            sys.modules['pipeline_metrics'].stop_metrics()
+        # Confirmar los mensajes y archivos pendientes antes de cerrar la base de datos
+        close_write_queues()
+        get_database().close_all()
+
 
 if __name__ == '__main__':
     FaceRecognitionApp().run()
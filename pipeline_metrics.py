@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from kivy.clock import Clock
+from kivy.uix.label import Label
+
+# Contexto vacío compartido: con las métricas desactivadas stage() no reserva nada
+_NULL_STAGE = nullcontext()
+
+
+class PipelineMetrics:
+    """
+    Tiempos por etapa del pipeline de cámara (lectura, conversión, detección,
+    predicción, consultas, textura) sobre una ventana deslizante de las
+    últimas mediciones, más contadores de frames por segundo.
+    Desactivadas, stage() devuelve un contexto vacío y tick() retorna sin
+    hacer nada, así que la instrumentación puede quedarse en el código.
+    """
+
+    def __init__(self, window=300, enabled=False):
+        """
+        Args:
+            window: Mediciones que se conservan por etapa para los percentiles
+            enabled: Si es False no se mide nada
+        """
+        self.window = window
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._ticks = {}
+        self._counters = {}
+        self._providers = {}
+
+    def stage(self, name):
+        """
+        Contexto que mide la duración de una etapa:
+            with metrics.stage('detect'):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Añade una duración en segundos a la etapa indicada"""
+        if not self.enabled:
+            return
+        with self._lock:
+            timings = self._timings.get(name)
+            if timings is None:
+                timings = self._timings[name] = deque(maxlen=self.window)
+            timings.append(seconds)
+
+    def tick(self, name):
+        """Marca un evento (frame mostrado, reconocimiento terminado) para calcular FPS"""
+        if not self.enabled:
+            return
+        with self._lock:
+            ticks = self._ticks.get(name)
+            if ticks is None:
+                ticks = self._ticks[name] = deque(maxlen=self.window)
+            ticks.append(time.perf_counter())
+
+    def count(self, name, n=1):
+        """Incrementa un contador (por ejemplo, frames descartados)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def register_provider(self, name, provider):
+        """
+        Incluye en cada instantánea las estadísticas de un componente
+        Args:
+            name: Clave bajo la que aparecen
+            provider: Función sin argumentos que devuelve un dict (get_stats)
+        """
+        with self._lock:
+            self._providers[name] = provider
+
+    def unregister_provider(self, name):
+        with self._lock:
+            self._providers.pop(name, None)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._ticks.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {'stages': {etapa: percentiles en ms}, 'fps': {evento: fps},
+                'counters': {...}, más una clave por proveedor registrado}
+        """
+        with self._lock:
+            timings = {name: np.fromiter(values, dtype=np.float64) for name, values in self._timings.items()}
+            ticks = {name: list(values) for name, values in self._ticks.items()}
+            counters = dict(self._counters)
+            providers = dict(self._providers)
+
+        stages = {}
+        for name, values in timings.items():
+            if not values.size:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99)) * 1000.0
+            stages[name] = {
+                'count': int(values.size),
+                'mean_ms': float(values.mean() * 1000.0),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+            }
+        fps = {}
+        for name, values in ticks.items():
+            if len(values) >= 2 and values[-1] > values[0]:
+                fps[name] = (len(values) - 1) / (values[-1] - values[0])
+        snapshot = {'time': time.time(), 'stages': stages, 'fps': fps, 'counters': counters}
+        for name, provider in providers.items():
+            try:
+                snapshot[name] = provider()
+            except Exception as e:
+                snapshot[name] = {'error': str(e)}
+        return snapshot
+
+    def format(self, snapshot=None):
+        """Texto corto con las métricas, para la superposición en pantalla"""
+        snapshot = snapshot or self.snapshot()
+        lines = [' '.join(f"{name} {value:.1f} fps" for name, value in sorted(snapshot['fps'].items()))]
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append(f"{name}: {stage['p50_ms']:.1f}/{stage['p95_ms']:.1f}/{stage['p99_ms']:.1f} ms")
+        for key in ('grabber', 'worker'):
+            if isinstance(snapshot.get(key), dict) and 'dropped' in snapshot[key]:
+                lines.append(f"{key}: {snapshot[key]['dropped']} descartados")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"{name}: {value}")
+        return '\n'.join(line for line in lines if line)
+
+
+class MetricsDumper:
+    """Hilo que añade periódicamente una instantánea de las métricas a un archivo JSON-lines"""
+
+    def __init__(self, metrics, path='logs/metrics.jsonl', interval=5.0):
+        """
+        Args:
+            metrics: PipelineMetrics a volcar
+            path: Archivo de destino; cada línea es un objeto JSON
+            interval: Segundos entre volcados
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MetricsDumper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        try:
+            line = json.dumps(self.metrics.snapshot(), default=str)
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            print(f"Error guardando métricas: {str(e)}")
+
+    def stop(self, timeout=1.0):
+        """Detiene el hilo tras un último volcado"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.dump()
+
+
+class MetricsOverlay(Label):
+    """Texto de depuración con las métricas, superpuesto en la esquina de la vista previa"""
+
+    def __init__(self, metrics=None, interval=0.5, **kwargs):
+        kwargs.setdefault('size_hint', (None, None))
+        kwargs.setdefault('size', (320, 200))
+        kwargs.setdefault('pos_hint', {'x': 0, 'top': 1})
+        kwargs.setdefault('font_size', '11sp')
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'top')
+        kwargs.setdefault('color', (0, 1, 0, 1))
+        super().__init__(**kwargs)
+        self.bind(size=lambda *_: setattr(self, 'text_size', self.size))
+        self.text_size = self.size
+        self.metrics = metrics or get_metrics()
+        self.interval = interval
+        self._event = None
+
+    def start(self):
+        if self._event is None:
+            self._event = Clock.schedule_interval(self._refresh, self.interval)
+
+    def stop(self):
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def _refresh(self, dt):
+        self.text = self.metrics.format()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+_dumper = None
+
+
+def get_metrics():
+    """
+    Instancia compartida de PipelineMetrics. Se activa con la variable de
+    entorno FACE_METRICS=1 o en caliente con F12 (enable_metrics());
+    FACE_METRICS_DUMP=<ruta> además vuelca las métricas a un archivo
+    JSON-lines cada FACE_METRICS_INTERVAL segundos
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = PipelineMetrics(enabled=os.environ.get('FACE_METRICS', '') not in ('', '0'))
+            dump_path = os.environ.get('FACE_METRICS_DUMP')
+            if dump_path:
+                _start_dumper(dump_path, float(os.environ.get('FACE_METRICS_INTERVAL', 5.0)))
+        return _metrics
+
+
+def _start_dumper(path, interval):
+    global _dumper
+    _metrics.enabled = True
+    if _dumper is not None:
+        _dumper.stop()
+    _dumper = MetricsDumper(_metrics, path, interval)
+    _dumper.start()
+
+
+def enable_metrics(dump_path=None, interval=5.0):
+    """Activa las métricas en caliente y, opcionalmente, el volcado periódico"""
+    metrics = get_metrics()
+    metrics.enabled = True
+    if dump_path:
+        with _metrics_lock:
+            _start_dumper(dump_path, interval)
+    return metrics
+
+
+def stop_metrics():
+    """Detiene el volcado periódico; llamado al cerrar la aplicación"""
+    global _dumper
+    with _metrics_lock:
+        if _dumper is not None:
+            _dumper.stop()
+            _dumper = None
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+from face_preprocessing import get_face_normalizer
+
+
+class SampleQualityGate:
+    """
+    Filtro de calidad para las muestras de registro.
+    Cada recorte se evalúa al tamaño canónico, así que los umbrales no
+    dependen de la distancia a la cámara. Se descartan los recortes borrosos
+    (varianza del laplaciano baja), los mal expuestos y los casi idénticos a
+    una muestra ya aceptada del mismo usuario, para que pocas muestras cubran
+    más variedad de pose y expresión.
+    """
+
+    REASONS = ('blur', 'dark', 'bright', 'clipped', 'duplicate')
+
+    def __init__(self, min_sharpness=50.0, min_brightness=40, max_brightness=215,
+                 max_clipped=0.25, max_similarity=0.92, signature_size=(24, 24), normalizer=None):
+        """
+        Args:
+            min_sharpness: Varianza mínima del laplaciano
+            min_brightness, max_brightness: Rango admitido del brillo medio (0-255)
+            max_clipped: Fracción máxima de píxeles saturados en negro o blanco
+            max_similarity: Correlación máxima con una muestra aceptada (1 = idéntica)
+            signature_size: Tamaño de la firma reducida usada para comparar muestras
+            normalizer: FaceNormalizer para llevar el recorte al tamaño canónico
+        """
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.max_similarity = max_similarity
+        self.signature_size = signature_size
+        self.normalizer = normalizer or get_face_normalizer()
+        self.reset()
+
+    def reset(self):
+        """Olvida las muestras aceptadas y los contadores (nuevo usuario)"""
+        self._signatures = []
+        self.accepted = 0
+        self.rejected = dict.fromkeys(self.REASONS, 0)
+
+    def _signature(self, face):
+        # Firma pequeña de media cero y norma uno: el producto escalar entre
+        # dos firmas es su correlación
+        small = cv2.resize(face, self.signature_size, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+        small -= small.mean()
+        norm = np.linalg.norm(small)
+        return small / norm if norm > 0 else small
+
+    def evaluate(self, face):
+        """
+        Evalúa un recorte sin registrarlo
+        Args:
+            face: Recorte de rostro en escala de grises de cualquier tamaño
+        Returns:
+            tuple: (motivo de rechazo o None si es válido, métricas del recorte)
+        """
+        face = self.normalizer.resize(face)
+        sharpness = float(cv2.Laplacian(face, cv2.CV_64F).var())
+        brightness = float(face.mean())
+        clipped = float(np.count_nonzero((face <= 5) | (face >= 250))) / face.size
+        signature = self._signature(face)
+        similarity = max((float(signature @ s) for s in self._signatures), default=0.0)
+        metrics = {
+            'sharpness': sharpness,
+            'brightness': brightness,
+            'clipped': clipped,
+            'similarity': similarity,
+            'signature': signature,
+        }
+
+        if sharpness < self.min_sharpness:
+            return 'blur', metrics
+        if brightness < self.min_brightness:
+            return 'dark', metrics
+        if brightness > self.max_brightness:
+            return 'bright', metrics
+        if clipped > self.max_clipped:
+            return 'clipped', metrics
+        if similarity > self.max_similarity:
+            return 'duplicate', metrics
+        return None, metrics
+
+    def check(self, face):
+        """
+        Evalúa un recorte y, si es válido, lo cuenta como muestra aceptada
+        Returns:
+            str or None: Motivo del rechazo, o None si se acepta
+        """
+        reason, metrics = self.evaluate(face)
+        if reason is None:
+            self._signatures.append(metrics['signature'])
+            self.accepted += 1
+        else:
+            self.rejected[reason] += 1
+        return reason
+
+    def get_stats(self):
+        """Muestras aceptadas y rechazadas por motivo"""
+        return {
+            'accepted': self.accepted,
+            'rejected': sum(self.rejected.values()),
+            'rejected_by_reason': dict(self.rejected),
+        }
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import argparse
+import threading
+import cv2
+import numpy as np
+from face_preprocessing import FACE_SIZE, FaceNormalizer
+
+SAMPLES_DIR = 'data/samples'
+SAMPLE_SIZE = FACE_SIZE  # (ancho, alto) de cada muestra guardada
+
+
+class SampleStore:
+    """
+    Muestras de entrenamiento guardadas como registros de tamaño fijo.
+    Cada usuario tiene un archivo data/samples/user_<id>.u8 con sus recortes de
+    rostro en escala de grises, todos redimensionados a SAMPLE_SIZE y puestos
+    uno detrás de otro. Se guardan sin ecualizar para que el entrenamiento
+    pueda aplicar el preprocesado que esté configurado. El entrenamiento
+    mapea el archivo en memoria y pasa los recortes directamente al
+    reconocedor, sin recorrer directorios ni decodificar JPEG.
+    """
+
+    def __init__(self, root=SAMPLES_DIR, size=SAMPLE_SIZE):
+        """
+        Args:
+            root: Directorio de los archivos de muestras
+            size: Tamaño (ancho, alto) de cada muestra
+        """
+        self.root = root
+        self.size = tuple(size)
+        self.record_bytes = self.size[0] * self.size[1]
+        self._resizer = FaceNormalizer(self.size)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._check_meta()
+
+    def _check_meta(self):
+        meta_path = os.path.join(self.root, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if tuple(meta.get('size', ())) != self.size:
+                raise Exception(f"El almacén de muestras usa tamaño {meta.get('size')} "
+                                f"y se esperaba {list(self.size)}")
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'size': list(self.size)}, f)
+
+    def path_for(self, user_id, pending=False):
+        """
+        Args:
+            pending: Si es True, ruta del registro provisional de una captura
+                en curso, que no sustituye al definitivo hasta commit_pending()
+        """
+        if pending:
+            return os.path.join(self.root, f'user_{user_id}.pending.u8')
+        return os.path.join(self.root, f'user_{user_id}.u8')
+
+    def normalize(self, face):
+        """Convierte un recorte de rostro al tamaño fijo del almacén"""
+        return np.ascontiguousarray(self._resizer.resize(face), dtype=np.uint8)
+
+    def append(self, user_id, face, pending=False):
+        """
+        Añade una muestra al final del archivo del usuario
+        Args:
+            user_id: ID del usuario
+            face: Recorte de rostro de cualquier tamaño
+            pending: Si es True la añade al registro provisional
+        Returns:
+            int: Número de muestras del registro tras añadirla
+        """
+        data = self.normalize(face).tobytes()
+        with self._lock:
+            with open(self.path_for(user_id, pending), 'ab') as f:
+                f.write(data)
+                return f.tell() // self.record_bytes
+
+    def count(self, user_id):
+        path = self.path_for(user_id)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // self.record_bytes
+
+    def has_samples(self, user_id):
+        return self.count(user_id) > 0
+
+    def load(self, user_id):
+        """
+        Mapea en memoria las muestras de un usuario
+        Returns:
+            ndarray: Matriz de solo lectura (n, alto, ancho); vacía si no hay muestras
+        """
+        n = self.count(user_id)
+        if n == 0:
+            return np.empty((0, self.size[1], self.size[0]), dtype=np.uint8)
+        # Un registro a medio escribir al final del archivo se ignora
+        return np.memmap(self.path_for(user_id), dtype=np.uint8, mode='r',
+                         shape=(n, self.size[1], self.size[0]))
+
+    def commit_pending(self, user_id):
+        """
+        Sustituye las muestras del usuario por las del registro provisional
+        Returns:
+            int: Número de muestras del usuario tras la sustitución
+        """
+        with self._lock:
+            pending = self.path_for(user_id, pending=True)
+            if not os.path.exists(pending):
+                raise Exception(f"No hay muestras provisionales del usuario {user_id}")
+            os.replace(pending, self.path_for(user_id))
+        return self.count(user_id)
+
+    def discard_pending(self, user_id):
+        """Descarta el registro provisional (captura cancelada o fallida)"""
+        with self._lock:
+            pending = self.path_for(user_id, pending=True)
+            if os.path.exists(pending):
+                os.remove(pending)
+
+    def user_ids(self):
+        ids = []
+        for name in os.listdir(self.root):
+            match = re.fullmatch(r'user_(\d+)\.u8', name)
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+
+def migrate_jpeg_tree(data_dir='data', store=None, remove=False):
+    """
+    Pasa las muestras antiguas data/user_<id>/*.jpg al almacén de muestras
+    Args:
+        data_dir: Directorio con las carpetas user_<id>
+        store: SampleStore de destino (por defecto el compartido)
+        remove: Si es True borra cada JPEG tras migrarlo
+    Returns:
+        dict: Muestras migradas por usuario
+    """
+    store = store or get_sample_store()
+    migrated = {}
+    for name in sorted(os.listdir(data_dir)):
+        match = re.fullmatch(r'user_(\d+)', name)
+        user_dir = os.path.join(data_dir, name)
+        if not match or not os.path.isdir(user_dir):
+            continue
+        user_id = int(match.group(1))
+        if store.has_samples(user_id):
+            print(f"Usuario {user_id} ya migrado, se omite")
+            continue
+        count = 0
+        for img_name in sorted(os.listdir(user_dir)):
+            img_path = os.path.join(user_dir, img_name)
+            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                print(f"Error procesando {img_path}")
+                continue
+            store.append(user_id, img)
+            count += 1
+            if remove:
+                os.remove(img_path)
+        if remove and not os.listdir(user_dir):
+            os.rmdir(user_dir)
+        migrated[user_id] = count
+        print(f"Usuario {user_id}: {count} muestras migradas")
+    return migrated
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sample_store():
+    """Instancia compartida de SampleStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SampleStore()
+        return _store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migración de muestras JPEG al almacén de muestras")
+    parser.add_argument('--data-dir', default='data',
+                        help="Directorio con las carpetas user_<id> (por defecto: data)")
+    parser.add_argument('--remove', action='store_true',
+                        help="Borra los JPEG una vez migrados")
+    args = parser.parse_args()
+
+    migrated = migrate_jpeg_tree(args.data_dir, remove=args.remove)
+    print(f"Migración completada: {sum(migrated.values())} muestras de {len(migrated)} usuarios")
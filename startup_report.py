@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StartupReport:
+    """
+    Desglose del arranque en frío por fases (importaciones, esquema, primera
+    pantalla, primer frame, precarga en segundo plano). Cada fase guarda
+    cuándo empezó y cuánto duró respecto al inicio del proceso.
+    """
+
+    def __init__(self, started=None):
+        """
+        Args:
+            started: time.perf_counter() del inicio; por defecto, ahora
+        """
+        self.started = started if started is not None else time.perf_counter()
+        self._phases = []
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end):
+        with self._lock:
+            self._phases.append({
+                'phase': name,
+                'start_ms': (start - self.started) * 1000.0,
+                'duration_ms': (end - start) * 1000.0,
+                'thread': threading.current_thread().name,
+            })
+
+    @contextmanager
+    def phase(self, name):
+        """Mide el bloque como una fase del arranque"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name):
+        """Registra un instante (fase de duración cero), p. ej. el primer frame"""
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def report(self):
+        with self._lock:
+            phases = sorted(self._phases, key=lambda phase: phase['start_ms'])
+        return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'phases': phases}
+
+    def print_report(self):
+        print("Arranque:")
+        for phase in self.report()['phases']:
+            print(f"  {phase['start_ms']:8.1f} ms  {phase['phase']:28s} {phase['duration_ms']:8.1f} ms"
+                  f"  [{phase['thread']}]")
+
+    def save(self, path='logs/startup.json'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
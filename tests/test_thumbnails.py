@@ -0,0 +1,61 @@
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from thumbnails import ThumbnailCache
+
+
+def _write_image(path, width, height):
+    rng = np.random.default_rng(0)
+    cv2.imwrite(str(path), rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    return str(path)
+
+
+def test_small_image_is_not_reduced_below_thumbnail_size(tmp_path):
+    cache = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160)
+    image = _write_image(tmp_path / 'small.png', 300, 200)
+
+    thumb = cv2.imread(cache.get(image))
+
+    assert thumb.shape[:2] == (106, 160)
+
+
+def test_image_smaller_than_thumbnail_keeps_its_size(tmp_path):
+    cache = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160)
+    image = _write_image(tmp_path / 'tiny.png', 120, 90)
+
+    thumb = cv2.imread(cache.get(image))
+
+    assert thumb.shape[:2] == (90, 120)
+
+
+def test_large_image_is_scaled_to_thumbnail_size(tmp_path):
+    cache = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160)
+    image = _write_image(tmp_path / 'large.jpg', 1600, 1200)
+
+    thumb = cv2.imread(cache.get(image))
+
+    assert thumb.shape[:2] == (120, 160)
+
+
+def test_known_content_key_finds_thumbnail_without_reading_original(tmp_path):
+    cache = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160)
+    image = _write_image(tmp_path / 'upload.jpg', 800, 600)
+    key = cache.content_key(image)
+    thumb = cache.get(image, key)
+    os.remove(image)
+
+    assert cache.request(image, key=key) == thumb
+
+
+def test_content_keys_survive_restart(tmp_path, monkeypatch):
+    image = _write_image(tmp_path / 'legacy.jpg', 800, 600)
+    thumb = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160).get(image)
+
+    restarted = ThumbnailCache(cache_dir=str(tmp_path / 'thumbs'), size=160)
+    monkeypatch.setattr(restarted, 'content_key', lambda path: pytest.fail("hashed the original again"))
+
+    assert restarted.request(image) == thumb
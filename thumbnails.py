@@ -0,0 +1,252 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+import cv2
+
+CACHE_DIR = 'cache/thumbnails'
+KEYS_FILE = 'keys.json'  # ruta -> (mtime, tamaño, hash) de las imágenes sin hash conocido
+
+
+class ThumbnailCache:
+    """
+    Miniaturas de las imágenes recibidas guardadas en disco.
+    Cada miniatura se genera una sola vez a partir del contenido del archivo
+    (el nombre es el hash del contenido), se decodifica en hilos de fondo y el
+    directorio se mantiene por debajo de max_bytes eliminando las menos usadas.
+    Las imágenes del almacén de subidas se buscan por el hash que ya guarda la
+    base de datos (files.blob_hash), sin abrir la original; las antiguas se
+    hashean una vez y la clave se guarda en KEYS_FILE para los siguientes
+    arranques.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, size=160, max_bytes=64 * 1024 * 1024, workers=2):
+        """
+        Args:
+            cache_dir: Directorio donde se guardan las miniaturas
+            size: Lado mayor de la miniatura en píxeles
+            max_bytes: Tamaño máximo del directorio de miniaturas
+            workers: Hilos dedicados a generar miniaturas
+        """
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Thumbnail')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # nombre -> bytes, del menos al más usado
+        self._total_bytes = 0
+        self._keys = {}  # ruta -> (mtime, tamaño, clave)
+        self._pending = {}  # ruta -> Future
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+        self._load_keys()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.jpg') or name.endswith('.tmp.jpg'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, nbytes in sorted(entries):
+            self._entries[name] = nbytes
+            self._total_bytes += nbytes
+
+    def _load_keys(self):
+        try:
+            with open(os.path.join(self.cache_dir, KEYS_FILE)) as f:
+                self._keys = {path: tuple(entry) for path, entry in json.load(f).items()}
+        except (OSError, ValueError):
+            self._keys = {}
+
+    def _save_keys(self):
+        keys_path = os.path.join(self.cache_dir, KEYS_FILE)
+        tmp_path = f"{keys_path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            keys = dict(self._keys)
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(keys, f)
+            os.replace(tmp_path, keys_path)
+        except OSError as e:
+            print(f"No se pudieron guardar las claves de miniaturas: {str(e)}")
+
+    def _known_key(self, path):
+        # Clave memorizada si el archivo no ha cambiado; solo cuesta un stat()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        cached = self._keys.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+        return None
+
+    def content_key(self, path):
+        """Hash del contenido del archivo, memorizado mientras no cambie"""
+        key = self._known_key(path)
+        if key is not None:
+            return key
+        st = os.stat(path)
+        digest = sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        key = digest.hexdigest()
+        with self._lock:
+            self._keys[path] = (st.st_mtime, st.st_size, key)
+        self._save_keys()
+        return key
+
+    def _thumbnail_name(self, key):
+        return f"{key}_{self.size}.jpg"
+
+    def _lookup(self, key):
+        name = self._thumbnail_name(key)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        thumb_path = os.path.join(self.cache_dir, name)
+        try:
+            os.utime(thumb_path)
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return thumb_path
+
+    def cached_path(self, path, key=None):
+        """
+        Ruta de la miniatura si ya existe, sin generarla
+        Args:
+            key: Hash del contenido si ya se conoce (files.blob_hash)
+        Returns:
+            str or None: Ruta de la miniatura o None
+        """
+        return self._lookup(key or self.content_key(path))
+
+    def get(self, path, key=None):
+        """
+        Devuelve la miniatura de path generándola si hace falta (bloqueante)
+        Args:
+            key: Hash del contenido si ya se conoce (files.blob_hash)
+        Returns:
+            str or None: Ruta de la miniatura o None si la imagen no se pudo leer
+        """
+        thumb_path = self.cached_path(path, key)
+        if thumb_path:
+            self.hits += 1
+            return thumb_path
+        self.misses += 1
+        return self._generate(path, key)
+
+    def request(self, path, callback=None, key=None):
+        """
+        Pide la miniatura sin bloquear
+        Args:
+            path: Imagen original
+            callback: Función callback(path, thumb_path) llamada desde un hilo
+                de fondo cuando la miniatura está lista (thumb_path None si falló)
+            key: Hash del contenido si ya se conoce (files.blob_hash); así una
+                miniatura existente se encuentra sin leer la original
+        Returns:
+            str or None: Ruta de la miniatura si ya estaba en caché; si no, None
+                y se genera en segundo plano
+        """
+        key = key or self._known_key(path)
+        thumb_path = self._lookup(key) if key is not None else None
+        if thumb_path:
+            self.hits += 1
+            return thumb_path
+
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._executor.submit(self.get, path, key)
+                self._pending[path] = future
+                future.add_done_callback(lambda f: self._pending.pop(path, None))
+        if callback:
+            future.add_done_callback(lambda f: callback(path, None if f.exception() else f.result()))
+        return None
+
+    def _generate(self, path, key=None):
+        key = key or self.content_key(path)
+        # IMREAD_REDUCED_* deja que el decodificador JPEG reduzca al decodificar
+        img = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+        if img is not None and max(img.shape[:2]) < self.size:
+            # Imagen pequeña: reducida a 1/4 quedaría por debajo de la
+            # miniatura, así que se decodifica con el menor factor suficiente
+            flag = cv2.IMREAD_REDUCED_COLOR_2 if max(img.shape[:2]) * 2 >= self.size else cv2.IMREAD_COLOR
+            img = cv2.imread(path, flag)
+        if img is None:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"No se pudo leer la imagen {path}")
+            return None
+
+        h, w = img.shape[:2]
+        scale = self.size / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+
+        name = self._thumbnail_name(key)
+        thumb_path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp.jpg"
+        if not cv2.imwrite(tmp_path, img, [cv2.IMWRITE_JPEG_QUALITY, 85]):
+            print(f"No se pudo guardar la miniatura {thumb_path}")
+            return None
+        os.replace(tmp_path, thumb_path)
+
+        with self._lock:
+            self._forget(name)
+            nbytes = os.path.getsize(thumb_path)
+            self._entries[name] = nbytes
+            self._total_bytes += nbytes
+            self._evict()
+        return thumb_path
+
+    def _forget(self, name):
+        nbytes = self._entries.pop(name, None)
+        if nbytes is not None:
+            self._total_bytes -= nbytes
+
+    def _evict(self):
+        # Eliminar las miniaturas menos usadas hasta respetar el límite
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, nbytes = self._entries.popitem(last=False)
+            self._total_bytes -= nbytes
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """Instancia compartida de ThumbnailCache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
@@ -1,60 +1,444 @@
 import os
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cv2
 import numpy as np
-import sqlite3
+from database import get_database
+from sample_store import get_sample_store
+from face_preprocessing import (FaceNormalizer, get_face_normalizer, set_face_normalizer,
+                                write_model_metadata, check_model_metadata)
 
-def train_model():
-    print("Iniciando entrenamiento del modelo...")
-    
+MODEL_PATH = "models/recognizer.yml"
+
+
+class TrainingCancelled(Exception):
+    """Se lanza cuando se cancela un entrenamiento en curso"""
+
+
+def _report(progress, phase, done=0, total=0):
+    if progress:
+        progress(phase, done, total)
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise TrainingCancelled("Entrenamiento cancelado")
+
+def list_user_samples(user_id):
+    """Rutas de las imágenes de rostro de un usuario en data/user_<id>"""
+    user_dir = f'data/user_{user_id}'
+    if not os.path.exists(user_dir):
+        return []
+    return [os.path.join(user_dir, img_name) for img_name in os.listdir(user_dir)]
+
+def load_samples(samples, progress=None, cancel_event=None):
+    """
+    Lee imágenes de rostro en escala de grises
+    Args:
+        samples: Lista de tuplas (ruta, etiqueta)
+        progress: Callback opcional progress(fase, hechas, total)
+        cancel_event: threading.Event opcional para cancelar la carga
+    Returns:
+        tuple: (faces, labels) con las imágenes válidas
+    """
+    faces = []
+    labels = []
+    total = len(samples)
+    for i, (img_path, label) in enumerate(samples, 1):
+        _check_cancelled(cancel_event)
+        try:
+            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                faces.append(img)
+                labels.append(label)
+                print(f"Procesada: {img_path}")
+        except Exception as e:
+            print(f"Error procesando {img_path}: {str(e)}")
+        _report(progress, 'loading', i, total)
+    return faces, labels
+
+def load_users(user_ids, progress=None, cancel_event=None, normalizer=None):
+    """
+    Reúne las muestras de varios usuarios. Las del almacén de muestras se
+    mapean en memoria y se pasan sin copiar si ya tienen el tamaño canónico;
+    los usuarios aún no migrados se leen de sus JPEG en data/user_<id>
+    Args:
+        user_ids: IDs de los usuarios
+        progress: Callback opcional progress(fase, hechas, total)
+        cancel_event: threading.Event opcional para cancelar la carga
+        normalizer: FaceNormalizer a aplicar (por defecto el compartido)
+    Returns:
+        tuple: (faces, labels) con los rostros normalizados
+    """
+    normalizer = normalizer or get_face_normalizer()
+    store = get_sample_store()
     faces = []
     labels = []
-    label_map = {}
-    
+    total = len(user_ids)
+    for i, user_id in enumerate(user_ids, 1):
+        _check_cancelled(cancel_event)
+        samples = store.load(user_id)
+        if len(samples):
+            faces.extend(normalizer.normalize(samples[j]) for j in range(len(samples)))
+            labels.extend([user_id] * len(samples))
+        else:
+            legacy_faces, legacy_labels = load_samples(
+                [(path, user_id) for path in list_user_samples(user_id)], cancel_event=cancel_event)
+            faces.extend(normalizer.normalize(face) for face in legacy_faces)
+            labels.extend(legacy_labels)
+        _report(progress, 'loading', i, total)
+    return faces, labels
+
+def _save_model(recognizer, progress=None, cancel_event=None):
+    _check_cancelled(cancel_event)
+    _report(progress, 'saving')
+    os.makedirs("models", exist_ok=True)
+    recognizer.save(MODEL_PATH)
+    write_model_metadata(MODEL_PATH, get_face_normalizer())
+
+def build_model(progress=None, cancel_event=None, save=True):
+    """
+    Entrena un reconocedor nuevo con las muestras de todos los usuarios
+    Args:
+        progress: Callback opcional progress(fase, hechas, total)
+        cancel_event: threading.Event opcional para cancelar
+        save: Si es True guarda el modelo en MODEL_PATH
+    Returns:
+        LBPHFaceRecognizer or None: Reconocedor entrenado o None si no hay imágenes
+    """
+    # Obtener usuarios registrados
+    user_ids = _registered_user_ids()
+
+    faces, labels = load_users(user_ids, progress, cancel_event)
+    if len(faces) == 0:
+        print("Error: No se encontraron imágenes para entrenar")
+        return None
+
+    # Entrenar el modelo
+    _check_cancelled(cancel_event)
+    _report(progress, 'training', 0, len(faces))
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(faces, np.array(labels))
+    _report(progress, 'training', len(faces), len(faces))
+
+    if save:
+        _save_model(recognizer, progress, cancel_event)
+
+    print(f"Modelo entrenado con {len(faces)} imágenes de {len(set(labels))} usuarios")
+    return recognizer
+
+def build_updated_model(user_id, progress=None, cancel_event=None, save=True):
+    """
+    Añade las muestras de un único usuario al modelo existente sin reentrenar
+    el resto. Si todavía no hay modelo guardado, o el usuario ya tenía muestras
+    en él (un nuevo registro de la misma cara), se hace un entrenamiento completo.
+    Args:
+        user_id: ID del usuario recién registrado
+        progress: Callback opcional progress(fase, hechas, total)
+        cancel_event: threading.Event opcional para cancelar
+        save: Si es True guarda el modelo en MODEL_PATH
+    Returns:
+        LBPHFaceRecognizer or None: Reconocedor actualizado o None si no hay imágenes
+    """
+    if not os.path.exists(MODEL_PATH) or os.path.getsize(MODEL_PATH) == 0:
+        print("No existe un modelo previo, se realizará un entrenamiento completo")
+        return build_model(progress, cancel_event, save)
     try:
-        conn = sqlite3.connect('models/users.db')
-        cursor = conn.cursor()
-        
-        # Obtener usuarios registrados
-        cursor.execute('SELECT id FROM users')
-        user_ids = [row[0] for row in cursor.fetchall()]
-        
-        for user_id in user_ids:
-            user_dir = f'data/user_{user_id}'
-            if not os.path.exists(user_dir):
-                continue
-                
-            for img_name in os.listdir(user_dir):
-                img_path = os.path.join(user_dir, img_name)
-                try:
-                    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-                    if img is not None:
-                        faces.append(img)
-                        labels.append(user_id)
-                        print(f"Procesada: {img_path}")
-                except Exception as e:
-                    print(f"Error procesando {img_path}: {str(e)}")
-        
-        if len(faces) == 0:
+        check_model_metadata(MODEL_PATH, get_face_normalizer())
+    except Exception as e:
+        # Mezclar histogramas de recortes preprocesados de otra forma daría
+        # un modelo incoherente
+        print(f"{str(e)}; se realizará un entrenamiento completo")
+        return build_model(progress, cancel_event, save)
+
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(MODEL_PATH)
+    if np.any(recognizer.getLabels() == user_id):
+        # update() solo añade histogramas: los del registro anterior seguirían
+        # en el modelo junto a los nuevos
+        print(f"El usuario {user_id} ya estaba en el modelo; se realizará un entrenamiento completo")
+        return build_model(progress, cancel_event, save)
+
+    print(f"Actualizando el modelo con las muestras del usuario {user_id}...")
+    faces, labels = load_users([user_id], progress, cancel_event)
+    if len(faces) == 0:
+        print(f"Error: No se encontraron imágenes del usuario {user_id}")
+        return None
+
+    _check_cancelled(cancel_event)
+    _report(progress, 'training', 0, len(faces))
+    recognizer.update(faces, np.array(labels))
+    _report(progress, 'training', len(faces), len(faces))
+
+    if save:
+        _save_model(recognizer, progress, cancel_event)
+
+    print(f"Modelo actualizado con {len(faces)} imágenes del usuario {user_id}")
+    return recognizer
+
+def _registered_user_ids():
+    return [row[0] for row in get_database().execute('SELECT id FROM users').fetchall()]
+
+def _train_shard(user_ids, out_dir, normalizer):
+    """
+    Entrena un fragmento de usuarios en un proceso del pool y guarda sus
+    histogramas en out_dir para que el proceso principal los mapee sin copiarlos
+    Returns:
+        tuple: (ruta de histogramas .npy, ruta de etiquetas .npy) o None si no hay imágenes
+    """
+    faces, labels = load_users(user_ids, normalizer=normalizer)
+    if not faces:
+        return None
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(faces, np.array(labels))
+    histograms = np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()])
+    name = f"shard_{os.getpid()}_{user_ids[0]}"
+    hist_path = os.path.join(out_dir, f"{name}_hist.npy")
+    labels_path = os.path.join(out_dir, f"{name}_labels.npy")
+    np.save(hist_path, histograms)
+    np.save(labels_path, recognizer.getLabels().ravel())
+    return hist_path, labels_path
+
+def _write_merged_model(path, shards, recognizer_params):
+    """
+    Escribe un modelo LBPH con los histogramas de todos los fragmentos.
+    Las matrices van en base64: OpenCV lo lee igual y escribir es mucho más
+    rápido que volcar cada histograma como texto
+    """
+    fs = cv2.FileStorage(path, cv2.FILE_STORAGE_WRITE | cv2.FILE_STORAGE_BASE64)
+    try:
+        fs.startWriteStruct('opencv_lbphfaces', cv2.FileNode_MAP)
+        fs.write('threshold', recognizer_params['threshold'])
+        fs.write('radius', recognizer_params['radius'])
+        fs.write('neighbors', recognizer_params['neighbors'])
+        fs.write('grid_x', recognizer_params['grid_x'])
+        fs.write('grid_y', recognizer_params['grid_y'])
+        fs.startWriteStruct('histograms', cv2.FileNode_SEQ)
+        all_labels = []
+        for histograms, labels in shards:
+            for row in histograms:
+                fs.write('', np.ascontiguousarray(row).reshape(1, -1))
+            all_labels.append(labels)
+        fs.endWriteStruct()
+        fs.write('labels', np.concatenate(all_labels).astype(np.int32).reshape(-1, 1))
+        fs.startWriteStruct('labelsInfo', cv2.FileNode_SEQ)
+        fs.endWriteStruct()
+        fs.endWriteStruct()
+    finally:
+        fs.release()
+
+def build_model_parallel(workers=None, progress=None, cancel_event=None, save=True, model_path=MODEL_PATH):
+    """
+    Reconstrucción completa repartiendo los usuarios entre varios procesos.
+    Cada proceso carga y calcula los histogramas LBPH de su fragmento; los
+    fragmentos se unen en un único modelo, equivalente al del entrenamiento
+    en serie. Solo compensa con muchos usuarios.
+    Args:
+        workers: Número de procesos (por defecto, uno por núcleo)
+        progress: Callback opcional progress(fase, hechas, total)
+        cancel_event: threading.Event opcional para cancelar
+        save: Si es True el modelo unido queda en model_path; si no, en un
+            archivo temporal que se borra tras cargarlo
+        model_path: Ruta del modelo a escribir
+    Returns:
+        LBPHFaceRecognizer or None: Reconocedor unido o None si no hay imágenes
+    """
+    workers = workers or os.cpu_count() or 1
+    user_ids = _registered_user_ids()
+    if not user_ids:
+        print("Error: No se encontraron imágenes para entrenar")
+        return None
+    # Fragmentos consecutivos: unidos en orden dan el mismo modelo que en serie
+    size = -(-len(user_ids) // workers)
+    shards = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+    with tempfile.TemporaryDirectory(prefix='lbph_shards_') as tmp_dir:
+        results = []
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            normalizer = get_face_normalizer()
+            futures = {pool.submit(_train_shard, shard, tmp_dir, normalizer): i
+                       for i, shard in enumerate(shards)}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    _check_cancelled(cancel_event)
+                    result = future.result()
+                    if result is not None:
+                        results.append((futures[future], result))
+                    _report(progress, 'training', done, len(futures))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        if not results:
             print("Error: No se encontraron imágenes para entrenar")
-            return False
-        
-        # Entrenar el modelo
+            return None
+
+        _check_cancelled(cancel_event)
+        _report(progress, 'saving')
+        # Los fragmentos terminan en cualquier orden; se unen en el del reparto
+        loaded = [(np.load(h, mmap_mode='r'), np.load(l)) for _, (h, l) in sorted(results)]
+        defaults = cv2.face.LBPHFaceRecognizer_create()
+        params = {
+            'threshold': defaults.getThreshold(),
+            'radius': defaults.getRadius(),
+            'neighbors': defaults.getNeighbors(),
+            'grid_x': defaults.getGridX(),
+            'grid_y': defaults.getGridY(),
+        }
+        target = model_path if save else os.path.join(tmp_dir, 'merged.yml')
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        _write_merged_model(target, loaded, params)
+        write_model_metadata(target, normalizer)
+        del loaded
+
         recognizer = cv2.face.LBPHFaceRecognizer_create()
-        recognizer.train(faces, np.array(labels))
-        
-        # Guardar el modelo
-        os.makedirs("models", exist_ok=True)
-        recognizer.save("models/recognizer.yml")
-        
-        print(f"Modelo entrenado con {len(faces)} imágenes de {len(set(labels))} usuarios")
-        return True
-        
+        recognizer.read(target)
+
+    samples = len(recognizer.getLabels())
+    print(f"Modelo entrenado en paralelo ({len(shards)} procesos) con {samples} imágenes "
+          f"de {len(user_ids)} usuarios")
+    return recognizer
+
+def compare_training(workers=None):
+    """
+    Mide el entrenamiento completo en serie y en paralelo sin tocar el modelo
+    guardado; ambos modos escriben su modelo en un directorio temporal
+    Returns:
+        dict: Segundos de cada modo y aceleración obtenida
+    """
+    with tempfile.TemporaryDirectory(prefix='lbph_compare_') as tmp_dir:
+        start = time.perf_counter()
+        recognizer = build_model(save=False)
+        if recognizer is not None:
+            recognizer.write(os.path.join(tmp_dir, 'serial.yml'))
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_model_parallel(workers, model_path=os.path.join(tmp_dir, 'parallel.yml'))
+        parallel = time.perf_counter() - start
+
+    report = {
+        'serial_seconds': serial,
+        'parallel_seconds': parallel,
+        'workers': workers or os.cpu_count() or 1,
+        'speedup': serial / parallel if parallel else 0.0,
+    }
+    print(f"Serie: {serial:.2f}s, paralelo: {parallel:.2f}s, aceleración x{report['speedup']:.2f}")
+    return report
+
+def train_model():
+    print("Iniciando entrenamiento del modelo...")
+    try:
+        return build_model() is not None
     except Exception as e:
         print(f"Error durante el entrenamiento: {str(e)}")
         return False
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+def update_model(user_id):
+    try:
+        return build_updated_model(user_id) is not None
+    except Exception as e:
+        print(f"Error durante la actualización: {str(e)}")
+        return False
+
+
+class TrainingJob:
+    """
+    Entrenamiento en un hilo de fondo dentro del propio proceso.
+    Los callbacks se invocan desde el hilo del trabajo; la interfaz debe
+    reenviarlos a su hilo principal.
+    """
+
+    def __init__(self, user_id=None, on_progress=None, on_complete=None):
+        """
+        Args:
+            user_id: Usuario a añadir de forma incremental; None reentrena todo
+            on_progress: Callback on_progress(fase, hechas, total)
+            on_complete: Callback on_complete(recognizer, error); recognizer es
+                None si falló, se canceló o no había imágenes
+        """
+        self.user_id = user_id
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.cancel_event = threading.Event()
+        self.recognizer = None
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        """Lanza el entrenamiento en segundo plano"""
+        self._thread = threading.Thread(target=self._run, name='TrainingJob', daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Solicita la cancelación; surte efecto en el siguiente punto de control"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            if self.user_id is None:
+                self.recognizer = build_model(self.on_progress, self.cancel_event)
+            else:
+                self.recognizer = build_updated_model(self.user_id, self.on_progress, self.cancel_event)
+            if self.recognizer is None:
+                self.error = Exception("No se encontraron imágenes para entrenar")
+        except Exception as e:
+            print(f"Error durante el entrenamiento: {str(e)}")
+            self.recognizer = None
+            self.error = e
+        finally:
+            # La conexión de este hilo no se reutiliza: cada trabajo usa un hilo nuevo
+            get_database().close()
+        if self.on_complete:
+            self.on_complete(self.recognizer, self.error)
+
 
 if __name__ == '__main__':
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Entrenamiento del reconocedor facial LBPH")
+    parser.add_argument('--user', type=int,
+                        help="Actualiza el modelo solo con las muestras de este usuario")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Reconstruye el modelo completo a partir de data/ (mantenimiento)")
+    parser.add_argument('--parallel', type=int, nargs='?', const=0, metavar='PROCESOS',
+                        help="Reconstruye el modelo repartiendo los usuarios entre procesos")
+    parser.add_argument('--compare', action='store_true',
+                        help="Compara el tiempo del entrenamiento en serie y en paralelo")
+    parser.add_argument('--size', default=None, metavar='ANCHOxALTO',
+                        help="Tamaño canónico de los recortes (por defecto 100x100)")
+    parser.add_argument('--equalize', action='store_true',
+                        help="Ecualiza el histograma de cada recorte antes de entrenar")
+    args = parser.parse_args()
+
+    if args.size or args.equalize:
+        size = tuple(int(v) for v in args.size.lower().split('x')) if args.size else get_face_normalizer().size
+        set_face_normalizer(FaceNormalizer(size, args.equalize))
+
+    if args.compare:
+        compare_training(args.parallel or None)
+        ok = True
+    elif args.user is not None and not args.rebuild:
+        ok = update_model(args.user)
+    elif args.parallel is not None:
+        try:
+            ok = build_model_parallel(args.parallel or None) is not None
+        except Exception as e:
+            print(f"Error durante el entrenamiento: {str(e)}")
+            ok = False
+    else:
+        ok = train_model()
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+UPLOADS_DIR = 'uploads'
+CHUNK_SIZE = 1024 * 1024
+
+# Archivo guardado en el almacén: hash del contenido, ruta relativa del blob,
+# tamaño en bytes, nombre original y si ya existía (envío duplicado)
+StoredBlob = namedtuple('StoredBlob', ['hash', 'path', 'size', 'name', 'duplicate'])
+
+
+def _copy_fd(src_fd, dst_fd, size, chunk_size=CHUNK_SIZE):
+    """
+    Copia size bytes entre descriptores dejando que el kernel mueva los datos
+    (copy_file_range o sendfile); si no están disponibles usa lectura/escritura
+    """
+    offset = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(chunk_size, size - offset), offset, offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError:
+            # Sistema de archivos o kernel sin soporte: seguir con otro método
+            pass
+    if offset < size and hasattr(os, 'sendfile'):
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        try:
+            while offset < size:
+                n = os.sendfile(dst_fd, src_fd, offset, min(chunk_size, size - offset))
+                if n == 0:
+                    break
+                offset += n
+        except OSError:
+            pass
+    if offset < size:
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < size:
+            data = os.pread(src_fd, min(chunk_size, size - offset), offset)
+            if not data:
+                break
+            os.write(dst_fd, data)
+            offset += len(data)
+    return offset
+
+
+class UploadStore:
+    """
+    Almacén de archivos subidos direccionado por contenido.
+    Cada archivo se guarda una sola vez como uploads/blobs/<hash[:2]>/<hash>.<ext>;
+    enviar la misma imagen a varios destinatarios solo añade filas en la
+    base de datos. Las copias se hacen en un hilo de fondo.
+    """
+
+    def __init__(self, root=UPLOADS_DIR, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            root: Directorio base de las subidas
+            chunk_size: Tamaño de bloque para leer y copiar
+        """
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='UploadStore')
+        self._hashes = {}  # ruta origen -> (mtime, tamaño, hash)
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}{ext}")
+
+    def hash_file(self, path):
+        """Hash SHA-256 leído por bloques, memorizado mientras el archivo no cambie"""
+        st = os.stat(path)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+        digest = sha256()
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                digest.update(view[:n])
+        result = digest.hexdigest()
+        with self._lock:
+            self._hashes[path] = (st.st_mtime, st.st_size, result)
+        return result
+
+    def store(self, src_path):
+        """
+        Guarda un archivo en el almacén (bloqueante)
+        Args:
+            src_path: Archivo a subir
+        Returns:
+            StoredBlob: Datos del blob guardado
+        """
+        name = os.path.basename(src_path)
+        ext = os.path.splitext(name)[1].lower()
+        digest = self.hash_file(src_path)
+        dest_path = self.blob_path(digest, ext)
+        size = os.path.getsize(src_path)
+        relative_path = os.path.relpath(dest_path, start=os.getcwd())
+
+        if os.path.exists(dest_path) and os.path.getsize(dest_path) == size:
+            return StoredBlob(digest, relative_path, size, name, True)
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                copied = _copy_fd(src.fileno(), dst.fileno(), size, self.chunk_size)
+            if copied != size:
+                raise Exception(f"Copia incompleta de {src_path}: {copied}/{size} bytes")
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return StoredBlob(digest, relative_path, size, name, False)
+
+    def store_async(self, src_path, callback=None):
+        """
+        Guarda un archivo en segundo plano
+        Args:
+            src_path: Archivo a subir
+            callback: Función opcional que recibe el Future al terminar (desde
+                el hilo del almacén)
+        Returns:
+            Future: Future con el StoredBlob
+        """
+        future = self._executor.submit(self.store, src_path)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Instancia compartida de UploadStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadStore()
+        return _store
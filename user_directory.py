@@ -0,0 +1,126 @@
+import threading
+from database import get_database
+
+
+class UserDirectory:
+    """
+    Copia en memoria de la tabla users con índices por username, id y face_id.
+    Se carga entera la primera vez que se consulta y se mantiene al día por
+    escritura directa: AuthSystem la actualiza en la misma operación que
+    escribe en SQLite. Si una búsqueda no encuentra al usuario se consulta la
+    base de datos por si otro proceso lo ha añadido.
+    Las filas tienen el mismo formato que SELECT * FROM users:
+    (id, username, password, face_id).
+    """
+
+    def __init__(self, db=None):
+        """
+        Args:
+            db: Database de la que se carga la tabla (por defecto la compartida)
+        """
+        self.db = db or get_database()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_id = {}
+        self._by_username = {}
+        self._by_face_id = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        rows = self.db.execute('SELECT * FROM users ORDER BY id').fetchall()
+        with self._lock:
+            if self._loaded:
+                return
+            for row in rows:
+                self._index(row)
+            self._loaded = True
+
+    def _index(self, row):
+        previous = self._by_id.get(row[0])
+        if previous is not None:
+            self._by_username.pop(previous[1], None)
+            if previous[3] is not None and self._by_face_id.get(previous[3]) == previous:
+                del self._by_face_id[previous[3]]
+        self._by_id[row[0]] = row
+        self._by_username[row[1]] = row
+        if row[3] is not None:
+            self._by_face_id[row[3]] = row
+
+    def _lookup(self, index, key, sql):
+        self._ensure_loaded()
+        with self._lock:
+            row = index.get(key)
+            if row is not None:
+                self.hits += 1
+                return row
+            self.misses += 1
+        row = self.db.execute(sql, (key,)).fetchone()
+        if row is not None:
+            with self._lock:
+                self._index(tuple(row))
+        return row
+
+    def by_username(self, username):
+        return self._lookup(self._by_username, username, 'SELECT * FROM users WHERE username=?')
+
+    def by_id(self, user_id):
+        return self._lookup(self._by_id, user_id, 'SELECT * FROM users WHERE id=?')
+
+    def by_face_id(self, face_id):
+        return self._lookup(self._by_face_id, face_id, 'SELECT * FROM users WHERE face_id=?')
+
+    def usernames(self):
+        """Nombres de todos los usuarios, en orden de registro"""
+        self._ensure_loaded()
+        with self._lock:
+            self.hits += 1
+            return [row[1] for row in sorted(self._by_id.values())]
+
+    def add(self, row):
+        """Añade o sustituye un usuario tras escribirlo en la base de datos"""
+        self._ensure_loaded()
+        with self._lock:
+            self._index(tuple(row))
+
+    def set_face_id(self, user_id, face_id):
+        """Refleja un UPDATE users SET face_id"""
+        self._ensure_loaded()
+        with self._lock:
+            row = self._by_id.get(user_id)
+            if row is not None:
+                self._index((row[0], row[1], row[2], face_id))
+
+    def invalidate(self):
+        """Descarta la copia; se recarga en la siguiente consulta"""
+        with self._lock:
+            self._by_id.clear()
+            self._by_username.clear()
+            self._by_face_id.clear()
+            self._loaded = False
+
+    def get_stats(self):
+        """Aciertos, fallos y tamaño de la caché"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._by_id),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(db=None):
+    """Instancia compartida de UserDirectory para la base de datos indicada"""
+    db = db or get_database()
+    with _directories_lock:
+        if db.path not in _directories:
+            _directories[db.path] = UserDirectory(db)
+        return _directories[db.path]
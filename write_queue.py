@@ -0,0 +1,201 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from database import get_database
+
+
+class WriteBehindQueue:
+    """
+    Cola de escrituras diferidas con confirmación agrupada (group commit).
+    Los INSERT se encolan sin bloquear y un hilo escritor los confirma en
+    una sola transacción cuando se juntan max_batch operaciones o la más
+    antigua lleva max_delay segundos esperando, de modo que muchos envíos
+    pagan un único commit. Cada operación va en su propio SAVEPOINT: si una
+    falla, solo su Future recibe la excepción y el resto del lote se confirma.
+    """
+
+    def __init__(self, db=None, max_batch=100, max_delay=0.05):
+        """
+        Args:
+            db: Database de destino (por defecto la compartida)
+            max_batch: Operaciones que fuerzan la confirmación inmediata
+            max_delay: Segundos máximos que espera una operación encolada
+        """
+        self.db = db or get_database()
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._in_flight = 0
+        self.batches = 0
+        self.operations = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name='WriteBehindQueue', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        """
+        Encola una sentencia
+        Returns:
+            Future: Se resuelve con el lastrowid tras confirmarse
+        """
+        return self.submit_many([(sql, params)])
+
+    def submit_many(self, statements):
+        """
+        Encola varias sentencias que se aplican juntas o ninguna
+        Args:
+            statements: Lista de tuplas (sql, params)
+        Returns:
+            Future: Se resuelve con la lista de lastrowid tras confirmarse
+                (o con un único lastrowid si solo había una sentencia)
+        """
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise Exception("La cola de escritura está cerrada")
+            self._pending.append((time.perf_counter(), list(statements), future))
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+            elif len(self._pending) == 1:
+                # Primera operación del lote: el escritor empieza a contar max_delay
+                self._cond.notify()
+        return future
+
+    @property
+    def pending(self):
+        """Operaciones encoladas o en confirmación"""
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            while self._running and len(self._pending) < self.max_batch:
+                remaining = self._pending[0][0] + self.max_delay - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if not self._running:
+                    break
+                continue
+            self._commit(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+        self.db.close()
+
+    def _commit(self, batch):
+        conn = self.db.connection()
+        results = []
+        try:
+            conn.execute('BEGIN')
+            for _, statements, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    results.append((future, None, None))
+                    continue
+                conn.execute('SAVEPOINT write_behind')
+                try:
+                    rowids = [conn.execute(sql, params).lastrowid for sql, params in statements]
+                    conn.execute('RELEASE write_behind')
+                    results.append((future, rowids[0] if len(rowids) == 1 else rowids, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_behind')
+                    conn.execute('RELEASE write_behind')
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            print(f"Error confirmando escrituras: {str(e)}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for _, _, future in batch:
+                if future.running():
+                    future.set_exception(e)
+            self.failures += len(batch)
+            return
+
+        self.batches += 1
+        for future, result, error in results:
+            if not future.running():
+                continue
+            self.operations += 1
+            if error is None:
+                future.set_result(result)
+            else:
+                self.failures += 1
+                future.set_exception(error)
+
+    def flush(self, timeout=None):
+        """
+        Espera a que se confirme todo lo encolado
+        Returns:
+            bool: False si se agotó el tiempo
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            if self._pending:
+                # No esperar a max_delay: confirmar ya
+                self._pending[0] = (float('-inf'),) + self._pending[0][1:]
+                self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Confirma lo pendiente y detiene el hilo escritor"""
+        self.flush(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        """Lotes confirmados, operaciones, fallos y tamaño medio de lote"""
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'operations': self.operations,
+                'failures': self.failures,
+                'mean_batch': self.operations / self.batches if self.batches else 0.0,
+                'pending': len(self._pending) + self._in_flight,
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db=None):
+    """Instancia compartida de WriteBehindQueue para la base de datos indicada"""
+    db = db or get_database()
+    with _queues_lock:
+        queue = _queues.get(db.path)
+        if queue is None or not queue._running:
+            queue = _queues[db.path] = WriteBehindQueue(db)
+        return queue
+
+
+def close_write_queues(timeout=5.0):
+    """Confirma y cierra todas las colas; llamado al cerrar la aplicación"""
+    with _queues_lock:
+        queues = list(_queues.values())
+        _queues.clear()
+    for queue in queues:
+        queue.close(timeout)